@@ -1,9 +1,17 @@
 from django.contrib import admin
 from django.contrib.admin.models import LogEntry
+from django.core.exceptions import PermissionDenied
+from django.db.models import Q
 from django.db.models.query import QuerySet
-from django.urls import reverse
+from django.http import JsonResponse, StreamingHttpResponse
+from django.urls import path, reverse
+from django.utils import timezone
 from django.utils.html import format_html
 
+from utils.instrumentation import request_metrics
+
+from . import search
+from .backup import iter_gzip, iter_lines
 from .models import Post, Category, Tag, Comment, Link, SideBar
 
 
@@ -38,11 +46,6 @@ class CategoryAdmin(BaseOwnerAdmin):
     list_display = ("name", "status", "is_nav", "created_time", "post_count")
     fields = ("name", "status", "is_nav")
 
-    def post_count(self, obj):
-        return obj.post_set.count()
-
-    post_count.short_description = "文章数量"
-
     def save_model(self, request, obj, form, change):
         obj.owner = request.user
         return super().save_model(request, obj, form, change)
@@ -50,7 +53,7 @@ class CategoryAdmin(BaseOwnerAdmin):
 
 @admin.register(Tag)
 class TagAdmin(BaseOwnerAdmin):
-    list_display = ("name", "status", "created_time")
+    list_display = ("name", "status", "created_time", "post_count")
 
     fields = ("name", "status")
 
@@ -88,11 +91,63 @@ class PostAdmin(BaseOwnerAdmin):
 
     operator.short_description = "操作"
 
+    def get_urls(self):
+        urls = [
+            path(
+                "backup/",
+                self.admin_site.admin_view(self.backup_view),
+                name="blog_post_backup",
+            ),
+            path(
+                "stats/",
+                self.admin_site.admin_view(self.stats_view),
+                name="blog_post_stats",
+            ),
+        ]
+        return urls + super().get_urls()
+
+    def backup_view(self, request):
+        """Stream a gzipped JSON Lines backup of the whole site."""
+        if not request.user.is_superuser:
+            raise PermissionDenied
+        response = StreamingHttpResponse(
+            iter_gzip(iter_lines()), content_type="application/gzip"
+        )
+        filename = f"dinah-{timezone.localtime():%Y%m%d-%H%M%S}.jsonl.gz"
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
+
+    def stats_view(self, request):
+        """Request timings of this process by URL pattern, p50/p95/p99 included."""
+        if not request.user.is_superuser:
+            raise PermissionDenied
+        return JsonResponse(request_metrics.summary())
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search.match_expression(search_term) or not search.is_available():
+            return super().get_search_results(request, queryset, search_term)
+        category_ids = Category.objects.filter(name__icontains=search_term).values_list(
+            "id", flat=True
+        )
+        queryset = queryset.filter(
+            Q(id__in=search.match_subquery(search_term))
+            | Q(category_id__in=list(category_ids))
+        )
+        return queryset, False
+
 
 @admin.register(Comment)
 class CommentAdmin(admin.ModelAdmin):
     list_display = ("target", "author", "content", "home_site", "created_time")
 
+    def get_readonly_fields(self, request, obj=None):
+        fields = super().get_readonly_fields(request, obj)
+        if obj is not None:
+            # NOTE: `path` and `root_id` are derived once, on creation, moving a
+            # comment would leave them and those of its replies stale
+            fields = (*fields, "target", "parent")
+        return fields
+
 
 @admin.register(Link)
 class LinkAdmin(admin.ModelAdmin):
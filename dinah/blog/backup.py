@@ -0,0 +1,87 @@
+import gzip
+import json
+import zlib
+from typing import Dict, Iterable, Iterator, List
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from blog.models import Category, Comment, Link, Post, SideBar, Tag
+
+# in restore order, referenced rows first
+BACKUP_MODELS = (Category, Tag, Post, Comment, Link, SideBar)
+
+
+def _post_tags(post_ids: List[int]) -> Dict[int, List[int]]:
+    tags: Dict[int, List[int]] = {post_id: [] for post_id in post_ids}
+    rows = (
+        Post.tag.through.objects.filter(post_id__in=post_ids)
+        .order_by("post_id", "tag_id")
+        .values_list("post_id", "tag_id")
+    )
+    for post_id, tag_id in rows:
+        tags[post_id].append(tag_id)
+    return tags
+
+
+def iter_records(model, chunk_size: int = 1000) -> Iterator[dict]:
+    """Rows of `model` in the `dumpdata` layout, read in primary key chunks.
+
+    Every chunk is a query of its own, so no read transaction stays open for
+    the whole backup.
+    """
+    pk_name = model._meta.pk.attname
+    fields = [
+        (field.attname, field.name)
+        for field in model._meta.concrete_fields
+        if not field.primary_key
+    ]
+    qs = model.objects.order_by("pk").values(
+        pk_name, *(attname for attname, _ in fields)
+    )
+    last_pk = None
+    while True:
+        chunk = qs if last_pk is None else qs.filter(pk__gt=last_pk)
+        rows = list(chunk[:chunk_size])
+        if not rows:
+            return
+        last_pk = rows[-1][pk_name]
+        tags = _post_tags([row[pk_name] for row in rows]) if model is Post else None
+        for row in rows:
+            record = {name: row[attname] for attname, name in fields}
+            if tags is not None:
+                record["tag"] = tags[row[pk_name]]
+            yield {
+                "model": model._meta.label_lower,
+                "pk": row[pk_name],
+                "fields": record,
+            }
+        if len(rows) < chunk_size:
+            return
+
+
+def iter_lines(chunk_size: int = 1000) -> Iterator[bytes]:
+    """The whole site as JSON Lines, one object per line."""
+    for model in BACKUP_MODELS:
+        for record in iter_records(model, chunk_size):
+            line = json.dumps(record, cls=DjangoJSONEncoder, ensure_ascii=False)
+            yield f"{line}\n".encode()
+
+
+def iter_gzip(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """Gzip a byte stream incrementally, for `StreamingHttpResponse`."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def write_backup(path: str, chunk_size: int = 1000) -> int:
+    """Write the gzipped JSON Lines backup to `path`, returns the rows written."""
+    total = 0
+    with gzip.open(path, "wb") as f:
+        for line in iter_lines(chunk_size):
+            f.write(line)
+            total += 1
+    return total
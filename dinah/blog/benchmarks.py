@@ -0,0 +1,266 @@
+"""Time the main read paths of the blog against the current database.
+
+Run `seed_blog` on an empty database first, then `benchmark --output` to
+write a JSON baseline and `benchmark --compare` on a later commit to see
+the differences. Targets are picked with a fixed seed, so two runs on the
+same dataset time the same pages.
+"""
+import dataclasses
+import platform
+import random
+import statistics
+import subprocess
+import time
+from typing import Callable, Dict, List, Optional
+
+import django
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count
+from django.test import RequestFactory
+from django.urls import resolve
+
+from blog.models import (
+    DISPLAY_COMMENT,
+    DISPLAY_HOT,
+    DISPLAY_LATEST,
+    DISPLAY_TAGS,
+    Category,
+    Comment,
+    Post,
+    SideBar,
+    Tag,
+)
+from blog.synthetic import ZipfChoice
+from utils.instrumentation import RequestStats, collecting
+from utils.pagination import encode_cursor
+
+BASELINE_VERSION = 1
+
+
+@dataclasses.dataclass(frozen=True)
+class Benchmark:
+    name: str
+    # one iteration, given the random source picking its target
+    run: Callable[[random.Random], object]
+    # clear the caches before every iteration, or time with warm caches
+    cold: bool = True
+
+
+@dataclasses.dataclass
+class Result:
+    iterations: int
+    min_ms: float
+    median_ms: float
+    p95_ms: float
+    mean_ms: float
+    queries: int
+    render_ms: float
+
+    @classmethod
+    def from_samples(cls, times: List[float], stats: List[RequestStats]) -> "Result":
+        times = sorted(times)
+        return cls(
+            iterations=len(times),
+            min_ms=round(times[0] * 1000, 3),
+            median_ms=round(statistics.median(times) * 1000, 3),
+            p95_ms=round(times[min(len(times) - 1, int(len(times) * 0.95))] * 1000, 3),
+            mean_ms=round(statistics.mean(times) * 1000, 3),
+            queries=round(statistics.median(s.queries for s in stats)),
+            render_ms=round(statistics.median(s.render_time for s in stats) * 1000, 3),
+        )
+
+
+def get_page(path: str, params: dict = None, user=None) -> bytes:
+    """Render `path` through its view, without middleware and view counting."""
+    request = RequestFactory().get(path, params or {})
+    request.user = user or AnonymousUser()
+    request.count_views = False
+    match = resolve(path)
+    response = match.func(request, *match.args, **match.kwargs)
+    if hasattr(response, "render"):
+        response.render()
+    if response.status_code != 200:
+        raise RuntimeError(f"{path} answered {response.status_code}")
+    return response.content
+
+
+def _changelist(model, user: User) -> Callable[[random.Random], bytes]:
+    model_admin = admin.site._registry[model]
+    path = f"/admin/{model._meta.app_label}/{model._meta.model_name}/"
+
+    def run(rng: random.Random) -> bytes:
+        request = RequestFactory().get(path)
+        request.user = user
+        response = model_admin.changelist_view(request)
+        return response.render().content
+
+    return run
+
+
+def _sidebar(display_type: int) -> Callable[[random.Random], str]:
+    # NOTE: not saved, its fragment is cached under an id no real sidebar has
+    sidebar = SideBar(
+        id=0, title="benchmark", display_type=display_type, status=SideBar.STATUS_SHOW
+    )
+    return lambda rng: sidebar.content_html
+
+
+def _pick(ids: List[int]) -> Callable[[random.Random], int]:
+    """Popular targets first: the ids are ordered by decreasing size."""
+    choose = ZipfChoice(len(ids))
+    return lambda rng: ids[choose(rng)]
+
+
+def build_benchmarks() -> List[Benchmark]:
+    published = Post.objects.filter(status=Post.STATUS_NORMAL)
+    post_ids = list(published.order_by("-id").values_list("id", flat=True)[:10000])
+    if not post_ids:
+        raise RuntimeError("no published post, seed the database first")
+    category_ids = list(
+        Category.objects.filter(status=Category.STATUS_NORMAL)
+        .order_by("-post_count")
+        .values_list("id", flat=True)
+    )
+    tag_ids = list(
+        Tag.objects.filter(status=Tag.STATUS_NORMAL, post_count__gt=0)
+        .order_by("-post_count")
+        .values_list("id", flat=True)
+    )
+    # a page deep in the listing, as reached by following the "next" links
+    deep_after = encode_cursor(
+        post_ids[min(len(post_ids) - 1, 50 * settings.POST_LIST_PAGE_SIZE)]
+    )
+    commented = list(
+        Comment.objects.values("target_id")
+        .annotate(count=Count("id"))
+        .order_by("-count")
+        .values_list("target_id", flat=True)[:1000]
+    )
+    # the author with the most posts, with every permission but not saved as such
+    author = User.objects.annotate(posts=Count("post")).order_by("-posts")[0]
+    author.is_superuser = True
+
+    pick_post = lambda rng: rng.choice(post_ids)  # noqa: E731
+    pick_category = _pick(category_ids)
+    pick_tag = _pick(tag_ids)
+    pick_commented = _pick(commented or post_ids)
+
+    benchmarks = []
+    for cold in (True, False):
+        suffix = "cold" if cold else "warm"
+        benchmarks += [
+            Benchmark(f"post_list/{suffix}", lambda rng: get_page("/"), cold),
+            Benchmark(
+                f"post_list_deep/{suffix}",
+                lambda rng: get_page("/", {"after": deep_after}),
+                cold,
+            ),
+            Benchmark(
+                f"post_details/{suffix}",
+                lambda rng: get_page(f"/post/{pick_post(rng)}"),
+                cold,
+            ),
+            Benchmark(
+                f"post_comments/{suffix}",
+                lambda rng: get_page(f"/post/{pick_commented(rng)}/comments"),
+                cold,
+            ),
+            Benchmark(
+                f"category_list/{suffix}",
+                lambda rng: get_page(f"/category/{pick_category(rng)}"),
+                cold,
+            ),
+            Benchmark(
+                f"tag_list/{suffix}",
+                lambda rng: get_page(f"/tag/{pick_tag(rng)}"),
+                cold,
+            ),
+            Benchmark(f"tags/{suffix}", lambda rng: get_page("/tags"), cold),
+        ]
+        for name, display_type in (
+            ("latest", DISPLAY_LATEST),
+            ("hot", DISPLAY_HOT),
+            ("comments", DISPLAY_COMMENT),
+            ("tag_cloud", DISPLAY_TAGS),
+        ):
+            benchmarks.append(
+                Benchmark(f"sidebar_{name}/{suffix}", _sidebar(display_type), cold)
+            )
+    benchmarks += [
+        Benchmark("admin_posts", _changelist(Post, author)),
+        Benchmark("admin_comments", _changelist(Comment, author)),
+    ]
+    return benchmarks
+
+
+def run_benchmark(
+    benchmark: Benchmark, repeat: int, warmup: int = 2, seed: int = 0
+) -> Result:
+    rng = random.Random(seed)
+    times, samples = [], []
+    for i in range(warmup + repeat):
+        if benchmark.cold:
+            cache.clear()
+        stats = RequestStats()
+        with connection.execute_wrapper(stats.execute_wrapper), collecting(stats):
+            started = time.perf_counter()
+            benchmark.run(rng)
+            elapsed = time.perf_counter() - started
+        if i >= warmup:
+            times.append(elapsed)
+            samples.append(stats)
+    return Result.from_samples(times, samples)
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=settings.BASE_DIR,
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment() -> dict:
+    """What the numbers depend on besides the code, stored with the baseline."""
+    return {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "database": connection.vendor,
+        "machine": platform.machine(),
+        "posts": Post.objects.count(),
+        "comments": Comment.objects.count(),
+        "tags": Tag.objects.count(),
+        "categories": Category.objects.count(),
+    }
+
+
+def compare(
+    results: Dict[str, dict], baseline: Dict[str, dict], threshold: float
+) -> List[str]:
+    """Names of the benchmarks slower than `threshold` times the baseline.
+
+    Timings are noisy, a slowdown also has to exceed a millisecond. Query
+    counts are exact, any increase counts.
+    """
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        slower = (
+            result["median_ms"] > previous["median_ms"] * threshold
+            and result["median_ms"] - previous["median_ms"] > 1
+        )
+        if slower or result["queries"] > previous["queries"]:
+            regressions.append(name)
+    return regressions
@@ -0,0 +1,61 @@
+import datetime
+import time
+from typing import Dict, Iterable
+
+from django.core.cache import cache
+
+SIDEBAR_VERSION = "sidebar"
+
+CATEGORY_VERSION = "category"
+
+COMMENTS_VERSION = "comments"
+
+TAG_CLOUD_VERSION = "tagcloud"
+
+# site-wide, its value is the time of the last content change in milliseconds
+CONTENT_VERSION = "content"
+
+
+def _version_key(name: str) -> str:
+    return f"version:{name}"
+
+
+def get_version(name: str) -> int:
+    """Current version of a group of cached entries, bumped on invalidation."""
+    key = _version_key(name)
+    version = cache.get(key)
+    if version is None:
+        # NOTE: seed from the clock so an evicted counter never reuses an old version
+        version = int(time.time() * 1000)
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+def get_versions(names: Iterable[str]) -> Dict[str, int]:
+    names = list(names)
+    found = cache.get_many([_version_key(name) for name in names])
+    return {name: found.get(_version_key(name)) or get_version(name) for name in names}
+
+
+def bump_version(name: str):
+    key = _version_key(name)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, int(time.time() * 1000), None)
+
+
+def touch_version(name: str, modified: datetime.datetime = None):
+    """Bump a version so that it also records when the change happened."""
+    key = _version_key(name)
+    modified_ms = int((modified.timestamp() if modified else time.time()) * 1000)
+    cache.set(key, max((cache.get(key) or 0) + 1, modified_ms), None)
+
+
+def version_time(version: int) -> datetime.datetime:
+    return datetime.datetime.fromtimestamp(version / 1000, tz=datetime.timezone.utc)
+
+
+def sidebar_cache_key(sidebar_id: int) -> str:
+    return f"sidebar:{sidebar_id}:{get_version(SIDEBAR_VERSION)}"
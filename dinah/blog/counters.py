@@ -0,0 +1,245 @@
+import atexit
+import datetime
+import logging
+import os
+import threading
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, Q, When
+from django.utils import timezone
+
+from blog.hll import HyperLogLog
+from utils.metrics import register_gauge
+
+logger = logging.getLogger(__name__)
+
+
+class PageViewBuffer:
+    """Write-behind buffer for `Post.pv` / `Post.uv`.
+
+    Increments and per-day visitor sketches are accumulated per post id in
+    process memory and written back by `flush()` in one batched transaction,
+    so the read path never takes the database write lock.
+    """
+
+    def __init__(self, flush_interval: float = 10.0, batch_size: int = 500):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._pending: Dict[int, int] = {}
+        self._visitors: Dict[Tuple[int, datetime.date], HyperLogLog] = {}
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def _check_fork(self):
+        # NOTE: deltas inherited from the parent process are flushed by the parent
+        if self._pid != os.getpid():
+            self._reset()
+
+    def incr(self, post_id: int, pv: int = 1, visitor: str = None):
+        self._check_fork()
+        with self._lock:
+            self._pending[post_id] = self._pending.get(post_id, 0) + pv
+            if visitor:
+                key = (post_id, timezone.localdate())
+                sketch = self._visitors.get(key)
+                if sketch is None:
+                    sketch = self._visitors[key] = HyperLogLog()
+                sketch.add(visitor)
+        if self._thread is None and self.flush_interval:
+            self.start()
+
+    def pending(self, post_id: int) -> int:
+        self._check_fork()
+        return self._pending.get(post_id, 0)
+
+    def pending_visitors(self, post_id: int, day: datetime.date = None) -> HyperLogLog:
+        """Visitors not yet flushed, for one day or for every buffered day."""
+        self._check_fork()
+        result = HyperLogLog()
+        with self._lock:
+            for (pid, d), sketch in self._visitors.items():
+                if pid == post_id and (day is None or d == day):
+                    result.merge(sketch)
+        return result
+
+    def snapshot(self) -> Dict[int, int]:
+        self._check_fork()
+        with self._lock:
+            return dict(self._pending)
+
+    def flush(self) -> int:
+        """Write pending deltas back, returns the number of posts updated."""
+        self._check_fork()
+        with self._lock:
+            deltas, self._pending = self._pending, {}
+            visitors, self._visitors = self._visitors, {}
+        if not deltas and not visitors:
+            return 0
+        try:
+            with transaction.atomic():
+                # NOTE: rows of posts deleted meanwhile would fail the foreign keys
+                alive = self._alive_posts(deltas.keys() | {pid for pid, _ in visitors})
+                self._write_pv({k: v for k, v in deltas.items() if k in alive})
+                self._write_visitors(
+                    {k: v for k, v in visitors.items() if k[0] in alive}
+                )
+        except Exception:
+            # put the deltas back so the next flush retries them
+            with self._lock:
+                for post_id, pv in deltas.items():
+                    self._pending[post_id] = self._pending.get(post_id, 0) + pv
+                for key, sketch in visitors.items():
+                    if key in self._visitors:
+                        self._visitors[key].merge(sketch)
+                    else:
+                        self._visitors[key] = sketch
+            raise
+        return len(deltas.keys() | {post_id for post_id, _ in visitors})
+
+    def _alive_posts(self, post_ids: Iterable[int]) -> Set[int]:
+        from blog.models import Post
+
+        post_ids = list(post_ids)
+        alive = set()
+        for i in range(0, len(post_ids), self.batch_size):
+            chunk = post_ids[i : i + self.batch_size]
+            alive.update(Post.objects.filter(id__in=chunk).values_list("id", flat=True))
+        return alive
+
+    def _write_pv(self, deltas: Dict[int, int]):
+        """Add the deltas to `Post.pv` and to the view bucket of this hour."""
+        from blog.hotness import bucket_start
+        from blog.models import Post, PostViewBucket
+
+        period = bucket_start(timezone.now())
+        items = list(deltas.items())
+        for i in range(0, len(items), self.batch_size):
+            chunk = items[i : i + self.batch_size]
+            post_ids = [post_id for post_id, _ in chunk]
+            Post.objects.filter(id__in=post_ids).update(
+                pv=Case(
+                    *[When(id=post_id, then=F("pv") + pv) for post_id, pv in chunk],
+                    default=F("pv")
+                )
+            )
+            PostViewBucket.objects.bulk_create(
+                [
+                    PostViewBucket(post_id=post_id, period=period)
+                    for post_id in post_ids
+                ],
+                ignore_conflicts=True,
+            )
+            PostViewBucket.objects.filter(period=period, post_id__in=post_ids).update(
+                views=Case(
+                    *[
+                        When(post_id=post_id, then=F("views") + pv)
+                        for post_id, pv in chunk
+                    ],
+                    default=F("views")
+                )
+            )
+
+    def _write_visitors(self, visitors: Dict[Tuple[int, datetime.date], HyperLogLog]):
+        """Merge buffered sketches into the stored ones and refresh `Post.uv`.
+
+        Every day's sketch is also folded into the post's all-time sketch
+        (`day=None`), whose estimate becomes the new `Post.uv`.
+        """
+        from blog.models import Post, VisitorSketch
+
+        deltas: Dict[Tuple[int, Optional[datetime.date]], HyperLogLog] = {}
+        for (post_id, day), sketch in visitors.items():
+            deltas[(post_id, day)] = sketch
+            total = deltas.setdefault((post_id, None), HyperLogLog(sketch.p))
+            total.merge(sketch)
+
+        post_ids = sorted({post_id for post_id, _ in deltas})
+        days = {day for _, day in deltas if day}
+        for i in range(0, len(post_ids), self.batch_size):
+            chunk = post_ids[i : i + self.batch_size]
+            rows = (
+                VisitorSketch.objects.select_for_update()
+                .filter(post_id__in=chunk)
+                .filter(Q(day__in=days) | Q(day__isnull=True))
+            )
+            stored: Dict[Tuple[int, Optional[datetime.date]], List[VisitorSketch]] = {}
+            for row in rows:
+                key = (row.post_id, row.day)
+                if key in deltas:
+                    stored.setdefault(key, []).append(row)
+
+            changed, created, duplicated, uvs = [], [], [], []
+            for key in [key for key in deltas if key[0] in chunk]:
+                sketch = deltas[key]
+                # NOTE: merging is idempotent, so duplicated rows from racing inserts are folded in
+                for row in stored.get(key, ()):
+                    sketch.merge(HyperLogLog.from_bytes(row.sketch))
+                if key in stored:
+                    row, *extra = stored[key]
+                    row.sketch = sketch.to_bytes()
+                    changed.append(row)
+                    duplicated.extend(r.id for r in extra)
+                else:
+                    created.append(
+                        VisitorSketch(
+                            post_id=key[0], day=key[1], sketch=sketch.to_bytes()
+                        )
+                    )
+                if key[1] is None:
+                    uvs.append(Post(id=key[0], uv=sketch.count()))
+
+            VisitorSketch.objects.bulk_update(changed, ["sketch"])
+            VisitorSketch.objects.bulk_create(created)
+            if duplicated:
+                VisitorSketch.objects.filter(id__in=duplicated).delete()
+            Post.objects.bulk_update(uvs, ["uv"])
+
+    def start(self):
+        self._check_fork()
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(
+                target=self._run, name="pv-buffer-flusher", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._flush_quietly()
+
+    def _flush_quietly(self):
+        from django.db import connection
+
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("failed to flush page views")
+        finally:
+            connection.close()
+
+    def _run(self):
+        while not self._stopped.wait(self.flush_interval):
+            self._flush_quietly()
+
+
+pv_buffer = PageViewBuffer(
+    flush_interval=getattr(settings, "PV_FLUSH_INTERVAL", 10.0),
+    batch_size=getattr(settings, "PV_FLUSH_BATCH_SIZE", 500),
+)
+
+# flush on shutdown
+atexit.register(pv_buffer.stop)
+
+register_gauge(
+    "dinah_pending_page_views",
+    "Page views counted but not yet written back.",
+    lambda: sum(pv_buffer.snapshot().values()),
+)
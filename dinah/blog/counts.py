@@ -0,0 +1,40 @@
+from typing import Iterable
+
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from blog.models import Category, Post, Tag
+
+
+def adjust_category(category_id: int, delta: int):
+    if category_id is not None and delta:
+        Category.objects.filter(id=category_id).update(
+            post_count=F("post_count") + delta
+        )
+
+
+def adjust_tags(tag_ids: Iterable[int], delta: int):
+    tag_ids = list(tag_ids)
+    if tag_ids and delta:
+        Tag.objects.filter(id__in=tag_ids).update(post_count=F("post_count") + delta)
+
+
+def _published_count(**lookups) -> Coalesce:
+    counts = (
+        Post.objects.filter(status=Post.STATUS_NORMAL, **lookups)
+        .order_by()
+        .values(*lookups)
+        .annotate(count=Count("id"))
+        .values("count")
+    )
+    return Coalesce(
+        Subquery(counts, output_field=IntegerField()),
+        Value(0),
+        output_field=IntegerField(),
+    )
+
+
+def recount_posts():
+    """Recompute every `post_count` with one aggregating UPDATE per table."""
+    Category.objects.update(post_count=_published_count(category=OuterRef("pk")))
+    Tag.objects.update(post_count=_published_count(tag=OuterRef("pk")))
@@ -0,0 +1,253 @@
+import dataclasses
+import json
+import os
+import re
+import tempfile
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.test import RequestFactory
+from django.urls import resolve
+from django.utils.dateparse import parse_datetime
+
+from blog import pagecache, tagcloud
+from blog.models import Category, Comment, Post, SideBar, Tag
+from utils.pagination import encode_cursor
+
+MANIFEST_NAME = ".manifest.json"
+
+MANIFEST_VERSION = 1
+
+# links to the later pages of the exported listings
+LISTING_LINK = re.compile(rb'href="(/|/category/\d+|/tag/\d+)\?after=([\w-]+)"')
+
+
+@dataclasses.dataclass(frozen=True)
+class Page:
+    """A public URL, optionally a later page of a paginated listing."""
+
+    path: str
+    after: Optional[str] = None
+    # posts shown on the page, a listing page is stale once this window changes
+    post_ids: Tuple[int, ...] = dataclasses.field(default=(), compare=False)
+
+    @property
+    def filename(self) -> str:
+        """File serving the page, relative to the export root.
+
+        `/` maps to `index.html` and `/post/1` to `post/1.html`; a listing page
+        reached with `?after=<token>` goes to `<base>/page/<token>.html`,
+        `page/<token>.html` for the home page.
+        """
+        base = self.path.strip("/")
+        if self.after:
+            return os.path.join(base, "page", f"{self.after}.html")
+        return f"{base or 'index'}.html"
+
+
+def listing_pages(path: str, post_ids: Iterable[int], per_page: int) -> Iterator[Page]:
+    """Pages of a listing given its post ids in `-id` order, like `paginate_by_id`."""
+    after, window = None, []
+    for post_id in post_ids:
+        if len(window) == per_page:
+            yield Page(path, after, tuple(window))
+            after, window = encode_cursor(window[-1]), []
+        window.append(post_id)
+    yield Page(path, after, tuple(window))
+
+
+def published_posts():
+    return Post.objects.filter(status=Post.STATUS_NORMAL).order_by("-id")
+
+
+def category_pages(category_id: int) -> Iterator[Page]:
+    post_ids = (
+        published_posts().filter(category_id=category_id).values_list("id", flat=True)
+    )
+    return listing_pages(
+        f"/category/{category_id}", post_ids.iterator(), settings.POST_LIST_PAGE_SIZE
+    )
+
+
+def tag_pages(tag_id: int) -> Iterator[Page]:
+    post_ids = published_posts().filter(tag=tag_id).values_list("id", flat=True)
+    return listing_pages(
+        f"/tag/{tag_id}", post_ids.iterator(), settings.POST_LIST_PAGE_SIZE
+    )
+
+
+def home_pages() -> Iterator[Page]:
+    post_ids = published_posts().values_list("id", flat=True)
+    return listing_pages("/", post_ids.iterator(), settings.POST_LIST_PAGE_SIZE)
+
+
+def site_pages() -> Iterator[Page]:
+    """Every public page of the blog."""
+    yield from home_pages()
+    categories = Category.objects.filter(status=Category.STATUS_NORMAL)
+    for category_id in categories.values_list("id", flat=True):
+        yield from category_pages(category_id)
+    for tag_id in Tag.objects.filter(status=Tag.STATUS_NORMAL).values_list(
+        "id", flat=True
+    ):
+        yield from tag_pages(tag_id)
+    yield Page("/tags")
+    for post_id in published_posts().values_list("id", flat=True).iterator():
+        yield Page(f"/post/{post_id}", post_ids=(post_id,))
+
+
+def render_page(page: Page) -> Tuple[Optional[bytes], List[str]]:
+    """Render a page through its view, without middleware and view counting.
+
+    Returns the content, None unless the view answered 200, and the
+    dependencies the view declared through `pagecache.depends_on()`.
+    """
+    request = RequestFactory().get(
+        page.path, {"after": page.after} if page.after else {}
+    )
+    request.user = AnonymousUser()
+    request.count_views = False
+    match = resolve(page.path)
+    response = match.func(request, *match.args, **match.kwargs)
+    deps = sorted(getattr(request, "page_deps", ()))
+    if response.status_code != 200:
+        return None, deps
+    return response.content, deps
+
+
+def rewrite_links(content: bytes) -> bytes:
+    """Point `?after=<token>` listing links to the files the pages are written to."""
+    return LISTING_LINK.sub(
+        lambda match: b'href="/%s"'
+        % Page(match[1].decode(), match[2].decode()).filename.encode(),
+        content,
+    )
+
+
+def write_atomic(root: str, filename: str, content: bytes):
+    """Write a file so that a web server never sees it half written."""
+    path = os.path.join(root, filename)
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".export-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def export_pages(root: str, pages: List[Page]) -> Dict[str, dict]:
+    """Render and write `pages`, returns the manifest entries of the written ones."""
+    entries = {}
+    for page in pages:
+        content, deps = render_page(page)
+        if content is None:
+            continue
+        write_atomic(root, page.filename, rewrite_links(content))
+        entries[page.filename] = {
+            "path": page.path,
+            "after": page.after,
+            "post_ids": list(page.post_ids),
+            "deps": deps,
+        }
+    return entries
+
+
+def sidebar_post_ids() -> List[int]:
+    """Posts shown by the latest and hot sidebars, in display order."""
+    count = settings.SIDEBAR_POST_COUNT
+    return [
+        *Post.latest_post().values_list("id", flat=True)[:count],
+        *Post.hot_posts().values_list("id", flat=True)[:count],
+    ]
+
+
+def site_state() -> dict:
+    """What the manifest compares against to notice deletions and reorderings."""
+    return {
+        "sidebar_posts": sidebar_post_ids(),
+        "sidebars": list(SideBar.get_all().values_list("id", flat=True)),
+        "categories": list(
+            Category.objects.filter(status=Category.STATUS_NORMAL).values_list(
+                "id", flat=True
+            )
+        ),
+        "tag_cloud": [list(item) for item in tagcloud.tag_cloud_items()],
+    }
+
+
+def load_manifest(root: str) -> Optional[dict]:
+    try:
+        with open(os.path.join(root, MANIFEST_NAME)) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return None
+    return manifest if manifest.get("version") == MANIFEST_VERSION else None
+
+
+def save_manifest(root: str, manifest: dict):
+    manifest["version"] = MANIFEST_VERSION
+    write_atomic(root, MANIFEST_NAME, json.dumps(manifest).encode())
+
+
+def stale_pages(pages: Iterable[Page], manifest: dict, state: dict) -> List[Page]:
+    """Pages of `pages` that differ from what the manifest says was exported.
+
+    A page is stale when it is new, when the posts it lists changed (a post
+    added, removed or reordered in a listing), when one of those posts was
+    edited or commented, or when a category, tag, the sidebars or the
+    navigation it declared as dependency changed since the last export.
+    Deleted comments leave no trace to compare against, they show until the
+    page is re-rendered for another reason or by a full export.
+    """
+    since = parse_datetime(manifest["exported_at"])
+    changed_posts = set(
+        Post.objects.filter(updated_time__gte=since).values_list("id", flat=True)
+    )
+    changed_posts.update(
+        Comment.objects.filter(created_time__gte=since).values_list(
+            "target_id", flat=True
+        )
+    )
+
+    dirty = {
+        pagecache.tag_dep(tag_id)
+        for tag_id in Tag.objects.filter(updated_time__gte=since).values_list(
+            "id", flat=True
+        )
+    }
+    changed_categories = list(
+        Category.objects.filter(updated_time__gte=since).values_list("id", flat=True)
+    )
+    dirty.update(
+        pagecache.category_dep(category_id) for category_id in changed_categories
+    )
+    if changed_categories or state["categories"] != manifest["categories"]:
+        dirty.add(pagecache.NAVS)
+    if (
+        SideBar.objects.filter(updated_time__gte=since).exists()
+        or state["sidebars"] != manifest["sidebars"]
+        or state["sidebar_posts"] != manifest["sidebar_posts"]
+        or changed_posts.intersection(state["sidebar_posts"])
+    ):
+        dirty.add(pagecache.SIDEBARS)
+    if state["tag_cloud"] != manifest.get("tag_cloud"):
+        dirty.add(pagecache.TAGS)
+
+    exported = manifest["pages"]
+    stale = []
+    for page in pages:
+        entry = exported.get(page.filename)
+        if (
+            entry is None
+            or tuple(entry["post_ids"]) != page.post_ids
+            or changed_posts.intersection(page.post_ids)
+            or dirty.intersection(entry["deps"])
+        ):
+            stale.append(page)
+    return stale
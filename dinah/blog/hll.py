@@ -0,0 +1,87 @@
+import hashlib
+import math
+import struct
+from typing import Iterable
+
+_DENSE = b"D"
+_SPARSE = b"S"
+
+
+class HyperLogLog:
+    """HyperLogLog cardinality sketch.
+
+    With the default precision the sketch estimates unique visitors with ~1.6%
+    standard error in at most 4KB. Sketches of the same precision merge by
+    taking the register-wise max, which is idempotent, so deltas collected by
+    different worker processes can be folded together in any order.
+    """
+
+    __slots__ = ("p", "m", "registers")
+
+    def __init__(self, p: int = 12, registers: bytes = None):
+        if not 4 <= p <= 16:
+            raise ValueError(f"precision must be in [4, 16], got {p}")
+        self.p = p
+        self.m = 1 << p
+        self.registers = bytearray(registers) if registers else bytearray(self.m)
+        if len(self.registers) != self.m:
+            raise ValueError(f"expected {self.m} registers, got {len(self.registers)}")
+
+    def add(self, value: str):
+        h = int.from_bytes(
+            hashlib.blake2b(value.encode(), digest_size=8).digest(), "big"
+        )
+        index = h >> (64 - self.p)
+        rest_bits = 64 - self.p
+        rest = h & ((1 << rest_bits) - 1)
+        rank = rest_bits - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def update(self, values: Iterable[str]):
+        for value in values:
+            self.add(value)
+
+    def merge(self, other: "HyperLogLog"):
+        if other.p != self.p:
+            raise ValueError("cannot merge sketches of different precision")
+        registers = self.registers
+        for i, value in enumerate(other.registers):
+            if value > registers[i]:
+                registers[i] = value
+
+    def count(self) -> int:
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        if estimate <= 2.5 * m:
+            zeros = self.registers.count(0)
+            if zeros:
+                estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def __len__(self):
+        return self.count()
+
+    def to_bytes(self) -> bytes:
+        """Serialize, using a sparse (index, rank) encoding for small sketches."""
+        nonzero = [(i, r) for i, r in enumerate(self.registers) if r]
+        if len(nonzero) * 3 < self.m:
+            body = b"".join(struct.pack(">HB", i, r) for i, r in nonzero)
+            return _SPARSE + bytes((self.p,)) + body
+        return _DENSE + bytes((self.p,)) + bytes(self.registers)
+
+    @classmethod
+    def from_bytes(cls, data: bytes, p: int = 12) -> "HyperLogLog":
+        if not data:
+            return cls(p)
+        data = bytes(data)
+        kind, p, body = data[:1], data[1], data[2:]
+        if kind == _DENSE:
+            return cls(p, body)
+        if kind != _SPARSE:
+            raise ValueError("unknown sketch encoding")
+        sketch = cls(p)
+        for i, r in struct.iter_unpack(">HB", body):
+            sketch.registers[i] = r
+        return sketch
@@ -0,0 +1,116 @@
+import datetime
+import math
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from blog.cache import CONTENT_VERSION, SIDEBAR_VERSION, bump_version, touch_version
+
+
+def bucket_start(moment: datetime.datetime) -> datetime.datetime:
+    """Start of the hourly view bucket `moment` falls in."""
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def add_log2(a: Optional[float], b: float) -> float:
+    """log2(2**a + 2**b) without leaving log space."""
+    if a is None:
+        return b
+    high, low = max(a, b), min(a, b)
+    return high + math.log2(1 + 2 ** (low - high))
+
+
+def view_score(views: int, period: datetime.datetime) -> float:
+    """log2 of `views` weighted by their age.
+
+    Scores are relative to the Unix epoch instead of to now: a view counts
+    twice as much as one `HOT_HALF_LIFE` older, and since every score decays
+    at the same rate the stored ones never need to be recomputed, only added
+    to. Working in log2 keeps the growing weights from overflowing.
+    """
+    return math.log2(views) + period.timestamp() / settings.HOT_HALF_LIFE
+
+
+def _shown_hot_posts() -> List[int]:
+    from blog.models import Post
+
+    count = settings.SIDEBAR_POST_COUNT
+    return list(Post.hot_posts().values_list("id", flat=True)[:count])
+
+
+def refresh_hotness(batch_size: int = 500) -> int:
+    """Fold view bucket increments into `HotPost`, returns the posts updated.
+
+    When the posts shown by the hot sidebar change, the pages showing it are
+    invalidated, their validators included.
+    """
+    from blog import pagecache
+    from blog.models import HotPost, PostViewBucket
+
+    shown = _shown_hot_posts()
+    updated = 0
+    while True:
+        with transaction.atomic():
+            buckets = list(
+                PostViewBucket.objects.select_for_update()
+                .filter(views__gt=F("ranked_views"))
+                .order_by("id")[:batch_size]
+            )
+            if not buckets:
+                break
+            gains: Dict[int, float] = {}
+            for bucket in buckets:
+                score = view_score(bucket.views - bucket.ranked_views, bucket.period)
+                gains[bucket.post_id] = add_log2(gains.get(bucket.post_id), score)
+                bucket.ranked_views = bucket.views
+            PostViewBucket.objects.bulk_update(buckets, ["ranked_views"])
+
+            ranked = HotPost.objects.select_for_update().in_bulk(list(gains))
+            changed, created = [], []
+            for post_id, gain in gains.items():
+                if post_id in ranked:
+                    row = ranked[post_id]
+                    row.score = add_log2(row.score, gain)
+                    changed.append(row)
+                else:
+                    created.append(HotPost(post_id=post_id, score=gain))
+            HotPost.objects.bulk_update(changed, ["score"])
+            HotPost.objects.bulk_create(created)
+            updated += len(gains)
+
+    # fully ranked old buckets are already part of the scores
+    expired = timezone.now() - settings.HOT_BUCKET_RETENTION
+    PostViewBucket.objects.filter(period__lt=expired, views=F("ranked_views")).delete()
+
+    if updated and _shown_hot_posts() != shown:
+        bump_version(SIDEBAR_VERSION)
+        pagecache.purge(pagecache.SIDEBARS)
+        touch_version(CONTENT_VERSION)
+    return updated
+
+
+def seed_from_pv() -> int:
+    """Rank published posts missing from `HotPost` by their stored `pv`.
+
+    Views without a time are counted at the time the post was created. Posts
+    still at the default `pv` were never viewed, they are left out.
+    """
+    from blog.models import HotPost, Post
+
+    unviewed = Post._meta.get_field("pv").default
+    rows = (
+        Post.objects.filter(
+            status=Post.STATUS_NORMAL, pv__gt=unviewed, hotness__isnull=True
+        )
+        .values_list("id", "pv", "created_time")
+        .iterator()
+    )
+    created = [
+        HotPost(post_id=post_id, score=view_score(pv, created_time))
+        for post_id, pv, created_time in rows
+    ]
+    HotPost.objects.bulk_create(created)
+    return len(created)
@@ -0,0 +1,290 @@
+import datetime
+import itertools
+import os
+import tarfile
+from concurrent.futures import Executor
+from typing import Dict, Iterable, Iterator, List, Set, Tuple
+
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from blog import pagecache, search, tagcloud
+from blog.cache import CONTENT_VERSION, SIDEBAR_VERSION, bump_version, touch_version
+from blog.counts import recount_posts
+from blog.models import Category, Post, Tag
+from blog.rendering import RENDERER_VERSION, render_post
+
+MARKDOWN_SUFFIXES = (".md", ".markdown")
+
+FRONT_MATTER = "---"
+
+STATUS_NAMES = {
+    "normal": Post.STATUS_NORMAL,
+    "published": Post.STATUS_NORMAL,
+    "draft": Post.STATUS_DRAFT,
+    "delete": Post.STATUS_DELETE,
+}
+
+
+def read_sources(path: str) -> Iterator[Tuple[str, str]]:
+    """(name, text) of the Markdown files in a directory or a tarball."""
+    if os.path.isdir(path):
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if filename.endswith(MARKDOWN_SUFFIXES):
+                    full_path = os.path.join(dirpath, filename)
+                    with open(full_path, encoding="utf-8") as f:
+                        yield os.path.relpath(full_path, path), f.read()
+        return
+    # NOTE: the stream mode reads the archive front to back without an index of members
+    with tarfile.open(path, "r|*") as archive:
+        for member in archive:
+            if member.isfile() and member.name.endswith(MARKDOWN_SUFFIXES):
+                data = archive.extractfile(member).read()
+                yield member.name, data.decode("utf-8")
+
+
+def _parse_value(value: str):
+    value = value.strip()
+    if value.startswith("[") and value.endswith("]"):
+        return [
+            item.strip().strip("\"'") for item in value[1:-1].split(",") if item.strip()
+        ]
+    return value.strip("\"'")
+
+
+def parse_front_matter(text: str) -> Tuple[Dict[str, object], str]:
+    """Split `key: value` front matter between `---` lines from the body.
+
+    Only the subset of YAML posts use is understood: scalars, `[a, b]` lists
+    and `- item` lists.
+    """
+    lines = text.lstrip("\ufeff").splitlines()
+    if not lines or lines[0].strip() != FRONT_MATTER:
+        return {}, text
+    meta: Dict[str, object] = {}
+    key = None
+    for i, line in enumerate(lines[1:], 1):
+        if line.strip() == FRONT_MATTER:
+            return meta, "\n".join(lines[i + 1 :]).strip("\n")
+        if not line.strip() or line.lstrip().startswith("#"):
+            continue
+        if line.lstrip().startswith("- ") and key:
+            if not isinstance(meta.get(key), list):
+                meta[key] = []
+            meta[key].append(_parse_value(line.lstrip()[2:]))
+            continue
+        key, sep, value = line.partition(":")
+        if not sep:
+            raise ValueError(f"invalid front matter line: {line!r}")
+        key = key.strip().lower()
+        meta[key] = _parse_value(value) if value.strip() else ""
+    raise ValueError("front matter is not closed")
+
+
+def _parse_time(value: str) -> datetime.datetime:
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"invalid date: {value!r}")
+        moment = datetime.datetime.combine(day, datetime.time())
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def check_name(model, name: str) -> str:
+    """`name` if it fits the `name` column of `model`, the database may not check."""
+    max_length = model._meta.get_field("name").max_length
+    if len(name) > max_length:
+        raise ValueError(
+            f"{model.__name__.lower()} name longer than {max_length} characters: "
+            f"{name!r}"
+        )
+    return name
+
+
+def parse_post(name: str, text: str) -> dict:
+    """Fields of a post from a Markdown file with front matter."""
+    meta, body = parse_front_matter(text)
+    for key, value in meta.items():
+        if key != "tags" and isinstance(value, list):
+            raise ValueError(f"{key} must be a single value, not a list")
+    tags = meta.get("tags") or []
+    if isinstance(tags, str):
+        tags = [tag.strip() for tag in tags.split(",") if tag.strip()]
+    status = str(meta.get("status") or "normal").lower()
+    if status not in STATUS_NAMES:
+        raise ValueError(f"unknown status: {status!r}")
+    title = meta.get("title") or os.path.splitext(os.path.basename(name))[0]
+    desc = meta.get("desc") or meta.get("description") or body.split("\n\n", 1)[0]
+    date = meta.get("date") or meta.get("created")
+    category = meta.get("category") or None
+    return {
+        "title": title[:255],
+        "desc": desc[:1024],
+        "content": body,
+        "category": category and check_name(Category, category),
+        "tags": [check_name(Tag, tag) for tag in tags],
+        "status": STATUS_NAMES[status],
+        "created_time": _parse_time(date) if date else None,
+    }
+
+
+def _lock_for_insert(model):
+    """Keep other transactions from inserting into `model` until this one ends."""
+    if connection.vendor == "sqlite":
+        table = connection.ops.quote_name(model._meta.db_table)
+        with connection.cursor() as cursor:
+            # NOTE: SQLite takes its write lock at the first write, even of no row
+            cursor.execute(f"UPDATE {table} SET id = id WHERE 0")
+    else:
+        # locks the highest row and the gap above it
+        list(model.objects.select_for_update().order_by("-id").values_list("id")[:1])
+
+
+class PostImporter:
+    """Insert posts in batches, resolving categories and tags by name.
+
+    Names are looked up in maps loaded once, the missing ones of a batch are
+    inserted together, so a batch costs a few bulk inserts whatever its size.
+    """
+
+    def __init__(
+        self,
+        owner: User,
+        default_category: str,
+        render: bool = True,
+        batch_size: int = 1000,
+        executor: Executor = None,
+    ):
+        self.owner = owner
+        self.default_category = default_category
+        self.render = render
+        self.executor = executor
+        self.batch_size = batch_size
+        self.categories = self._load_names(Category)
+        self.tags = self._load_names(Tag)
+        self.touched_categories: Set[int] = set()
+        self.touched_tags: Set[int] = set()
+
+    @staticmethod
+    def _load_names(model) -> Dict[str, int]:
+        names = {}
+        for pk, name in model.objects.order_by("-id").values_list("id", "name"):
+            names[name] = pk
+        return names
+
+    def _create_missing(self, model, names: Dict[str, int], wanted: Iterable[str]):
+        """Insert the `wanted` names not in `names` and add them to it."""
+        missing = set(wanted) - set(names)
+        if not missing:
+            return
+        # NOTE: bulk_create skips the save signals, `finish()` does their work once
+        model.objects.bulk_create(
+            model(name=name, owner=self.owner) for name in sorted(missing)
+        )
+        rows = model.objects.filter(name__in=missing).order_by("-id")
+        for pk, name in rows.values_list("id", "name"):
+            names[name] = pk
+
+    def import_records(self, records: Iterable[dict]) -> int:
+        total = 0
+        records = iter(records)
+        while True:
+            batch = list(itertools.islice(records, self.batch_size))
+            if not batch:
+                break
+            self._insert(batch)
+            total += len(batch)
+        return total
+
+    def _insert(self, records: List[dict]):
+        # names are resolved outside the batch transaction, so a failed batch
+        # can't leave the lookup maps pointing at rolled back rows
+        self._create_missing(
+            Category,
+            self.categories,
+            (record["category"] or self.default_category for record in records),
+        )
+        self._create_missing(
+            Tag, self.tags, (name for record in records for name in record["tags"])
+        )
+        posts, tag_ids = [], []
+        for record in records:
+            category_name = record["category"] or self.default_category
+            post = Post(
+                title=record["title"],
+                desc=record["desc"],
+                content=record["content"],
+                status=record["status"],
+                category_id=self.categories[category_name],
+                owner=self.owner,
+            )
+            posts.append(post)
+            tag_ids.append({self.tags[name] for name in record["tags"]})
+
+        if self.render:
+            self._render(posts)
+
+        with transaction.atomic():
+            if not connection.features.can_return_ids_from_bulk_insert:
+                # NOTE: allocate the ids ourselves so the tag rows can refer to them,
+                # under the write lock so that no other insert takes them meanwhile
+                _lock_for_insert(Post)
+                next_id = (Post.objects.aggregate(last=Max("id"))["last"] or 0) + 1
+                for i, post in enumerate(posts):
+                    post.id = next_id + i
+            # NOTE: the backend picks the insert batch size, SQLite caps compound selects
+            Post.objects.bulk_create(posts)
+
+            # bulk_create stamps auto_now_add fields, put the original dates back
+            dated = []
+            for post, record in zip(posts, records):
+                if record["created_time"]:
+                    post.created_time = record["created_time"]
+                    dated.append(post)
+            Post.objects.bulk_update(dated, ["created_time"])
+
+            Post.tag.through.objects.bulk_create(
+                [
+                    Post.tag.through(post_id=post.id, tag_id=tag_id)
+                    for post, ids in zip(posts, tag_ids)
+                    for tag_id in ids
+                ]
+            )
+            search.index_posts(posts)
+
+        self.touched_categories.update(post.category_id for post in posts)
+        for ids in tag_ids:
+            self.touched_tags.update(ids)
+
+    def _render(self, posts: List[Post]):
+        rows = [(i, post.content, post.desc) for i, post in enumerate(posts)]
+        if self.executor is None:
+            rendered = map(render_post, rows)
+        else:
+            rendered = self.executor.map(render_post, rows, chunksize=64)
+        for i, content_html, desc_html in rendered:
+            posts[i].content_html = content_html
+            posts[i].desc_html = desc_html
+            posts[i].render_version = RENDERER_VERSION
+
+    def finish(self):
+        """Invalidate what the signals skipped by `bulk_create()` would have."""
+        pagecache.purge(
+            pagecache.LATEST_POSTS,
+            pagecache.SIDEBARS,
+            *map(pagecache.category_posts_dep, self.touched_categories),
+            *map(pagecache.tag_posts_dep, self.touched_tags),
+        )
+        recount_posts()
+        tagcloud.refresh_tag_cloud()
+        Category.invalidate_navs()
+        bump_version(SIDEBAR_VERSION)
+        touch_version(CONTENT_VERSION)
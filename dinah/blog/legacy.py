@@ -0,0 +1,224 @@
+"""Copy a legacy typeidea database into the current blog models.
+
+typeidea kept posts, categories and tags in `blog`, links and sidebars in
+`config` and comments in `comment`. Rows keep their ids, so foreign keys
+and the post/tag links carry over unchanged.
+"""
+import dataclasses
+import datetime
+from typing import Callable, Dict, Iterator, Tuple, Type
+
+from django.contrib.auth.models import User
+from django.db import models, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from blog import search
+from blog.models import Category, Comment, Link, Post, SideBar, Tag
+
+# legacy STATUS_ITEMS value -> current STATUS value
+POST_STATUS = {1: Post.STATUS_NORMAL, 0: Post.STATUS_DELETE, 2: Post.STATUS_DRAFT}
+CATEGORY_STATUS = {1: Category.STATUS_NORMAL, 0: Category.STATUS_DELETE}
+TAG_STATUS = {1: Tag.STATUS_NORMAL, 0: Tag.STATUS_DELETE}
+LINK_STATUS = {1: Link.STATUS_NORMAL, 0: Link.STATUS_DELETE}
+SIDEBAR_STATUS = {1: SideBar.STATUS_SHOW, 0: SideBar.STATUS_HIDE}
+COMMENT_STATUS = {1: Comment.STATUS_NORMAL, 0: Comment.STATUS_DELETE}
+
+
+def _time(value) -> datetime.datetime:
+    if isinstance(value, str):
+        value = parse_datetime(value)
+    # typeidea ran with USE_TZ, so naive values are UTC
+    if value is not None and timezone.is_naive(value):
+        value = timezone.make_aware(value, timezone.utc)
+    return value
+
+
+def _status(mapping: Dict[int, int], value: int) -> int:
+    try:
+        return mapping[value]
+    except KeyError:
+        raise ValueError(f"unknown legacy status: {value!r}")
+
+
+@dataclasses.dataclass(frozen=True)
+class LegacyTable:
+    name: str
+    model: Type[models.Model]
+    columns: Tuple[str, ...]
+    convert: Callable[[dict], dict]
+
+
+LEGACY_TABLES = (
+    LegacyTable(
+        "auth_user",
+        User,
+        (
+            "id",
+            "password",
+            "last_login",
+            "is_superuser",
+            "username",
+            "first_name",
+            "last_name",
+            "email",
+            "is_staff",
+            "is_active",
+            "date_joined",
+        ),
+        lambda row: {
+            **row,
+            "last_login": _time(row["last_login"]),
+            "date_joined": _time(row["date_joined"]),
+        },
+    ),
+    LegacyTable(
+        "blog_category",
+        Category,
+        ("id", "name", "status", "is_nav", "owner_id", "created_time"),
+        lambda row: {
+            **row,
+            "status": _status(CATEGORY_STATUS, row["status"]),
+            "is_nav": bool(row["is_nav"]),
+            "created_time": _time(row["created_time"]),
+        },
+    ),
+    LegacyTable(
+        "blog_tag",
+        Tag,
+        ("id", "name", "status", "owner_id", "created_time"),
+        lambda row: {
+            **row,
+            "status": _status(TAG_STATUS, row["status"]),
+            "created_time": _time(row["created_time"]),
+        },
+    ),
+    LegacyTable(
+        "blog_post",
+        Post,
+        (
+            "id",
+            "title",
+            "desc",
+            "content",
+            "status",
+            "category_id",
+            "owner_id",
+            "created_time",
+        ),
+        lambda row: {
+            **row,
+            "status": _status(POST_STATUS, row["status"]),
+            "created_time": _time(row["created_time"]),
+        },
+    ),
+    LegacyTable("blog_post_tag", Post.tag.through, ("id", "post_id", "tag_id"), dict),
+    LegacyTable(
+        "config_link",
+        Link,
+        ("id", "title", "href", "status", "weight", "owner_id", "created_time"),
+        lambda row: {
+            "id": row["id"],
+            "title": row["title"],
+            "href": row["href"],
+            "status": _status(LINK_STATUS, row["status"]),
+            "rank": row["weight"],
+            "owner_id": row["owner_id"],
+            "created_time": _time(row["created_time"]),
+        },
+    ),
+    LegacyTable(
+        "config_sidebar",
+        SideBar,
+        (
+            "id",
+            "title",
+            "display_type",
+            "content",
+            "status",
+            "owner_id",
+            "created_time",
+        ),
+        lambda row: {
+            **row,
+            "status": _status(SIDEBAR_STATUS, row["status"]),
+            "created_time": _time(row["created_time"]),
+        },
+    ),
+    LegacyTable(
+        "comment_comment",
+        Comment,
+        (
+            "id",
+            "target_id",
+            "content",
+            "nickname",
+            "website",
+            "email",
+            "status",
+            "created_time",
+        ),
+        lambda row: {
+            "id": row["id"],
+            "target_id": row["target_id"],
+            # typeidea comments were flat, each is a thread of its own
+            "root_id": row["id"],
+            "path": "",
+            "content": row["content"],
+            "author": row["nickname"],
+            "home_site": row["website"],
+            "email": row["email"],
+            "status": _status(COMMENT_STATUS, row["status"]),
+            "created_time": _time(row["created_time"]),
+        },
+    ),
+)
+
+
+def read_rows(
+    source, table: LegacyTable, after: int = 0, batch_size: int = 1000
+) -> Iterator[list]:
+    """Batches of `table` rows from the `source` connection, by ascending id."""
+    quote = source.ops.quote_name
+    columns = ", ".join(quote(column) for column in table.columns)
+    sql = (
+        f"SELECT {columns} FROM {quote(table.name)} WHERE {quote('id')} > %s "
+        f"ORDER BY {quote('id')} LIMIT %s"
+    )
+    while True:
+        with source.cursor() as cursor:
+            cursor.execute(sql, [after, batch_size])
+            rows = [dict(zip(table.columns, row)) for row in cursor.fetchall()]
+        if not rows:
+            return
+        after = rows[-1]["id"]
+        yield rows
+
+
+def copy_rows(table: LegacyTable, rows: list) -> int:
+    """Insert one batch, returns the last legacy id it contained.
+
+    Rows whose id already exists are skipped, so a batch that was copied but
+    not checkpointed can simply be copied again.
+    """
+    values = [table.convert(row) for row in rows]
+    objs = [table.model(**kwargs) for kwargs in values]
+    if table.model is Post:
+        for post in objs:
+            post.render()
+    # bulk_create stamps auto_now(_add) fields with the current time
+    stamped = [
+        field.name
+        for field in table.model._meta.concrete_fields
+        if getattr(field, "auto_now", False) or getattr(field, "auto_now_add", False)
+    ]
+    with transaction.atomic():
+        table.model.objects.bulk_create(objs, ignore_conflicts=True)
+        if stamped:
+            for obj, kwargs in zip(objs, values):
+                for name in stamped:
+                    setattr(obj, name, kwargs.get(name) or kwargs["created_time"])
+            table.model.objects.bulk_update(objs, stamped)
+        if table.model is Post:
+            search.index_posts(objs)
+    return rows[-1]["id"]
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from blog.backup import write_backup
+
+
+class Command(BaseCommand):
+    help = "Back up categories, tags, posts, comments, links and sidebars to gzipped JSON Lines"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output", help="file to write, dinah-<timestamp>.jsonl.gz by default",
+        )
+        parser.add_argument(
+            "--chunk-size", type=int, default=1000, help="rows read per query"
+        )
+
+    def handle(self, *args, **options):
+        output = options["output"]
+        if not output:
+            output = f"dinah-{timezone.localtime():%Y%m%d-%H%M%S}.jsonl.gz"
+        total = write_backup(output, options["chunk_size"])
+        self.stdout.write(self.style.SUCCESS(f"done, {total} rows written to {output}"))
@@ -0,0 +1,89 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from blog.benchmarks import (
+    BASELINE_VERSION,
+    build_benchmarks,
+    compare,
+    environment,
+    run_benchmark,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Time post lists, post details, category and tag listings, sidebars and "
+        "admin changelists against the current database"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--repeat", type=int, default=20, help="timed iterations per benchmark"
+        )
+        parser.add_argument(
+            "--warmup", type=int, default=2, help="untimed iterations first"
+        )
+        parser.add_argument(
+            "--filter", default="", help="only benchmarks whose name contains this"
+        )
+        parser.add_argument("--output", help="write the results as a JSON baseline")
+        parser.add_argument(
+            "--compare", help="JSON baseline to compare with, fails on regressions"
+        )
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=1.25,
+            help="median slowdown ratio counted as a regression",
+        )
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options["compare"]:
+            with open(options["compare"]) as f:
+                baseline = json.load(f)
+            if baseline.get("version") != BASELINE_VERSION:
+                raise CommandError("the baseline was written by another version")
+
+        try:
+            benchmarks = build_benchmarks()
+        except RuntimeError as e:
+            raise CommandError(str(e))
+        results = {}
+        for benchmark in benchmarks:
+            if options["filter"] not in benchmark.name:
+                continue
+            result = run_benchmark(benchmark, options["repeat"], options["warmup"])
+            results[benchmark.name] = vars(result)
+            self.stdout.write(self._line(benchmark.name, vars(result), baseline))
+
+        if options["output"]:
+            report = {
+                "version": BASELINE_VERSION,
+                "created": timezone.now().isoformat(),
+                "environment": environment(),
+                "results": results,
+            }
+            with open(options["output"], "w") as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+                f.write("\n")
+
+        if baseline is not None:
+            regressions = compare(results, baseline["results"], options["threshold"])
+            if regressions:
+                raise CommandError(f"regressions: {', '.join(regressions)}")
+            self.stdout.write(self.style.SUCCESS("no regression"))
+
+    @staticmethod
+    def _line(name: str, result: dict, baseline: dict = None) -> str:
+        line = (
+            f"{name:<28} median {result['median_ms']:>9.3f}ms  "
+            f"p95 {result['p95_ms']:>9.3f}ms  queries {result['queries']:>3}"
+        )
+        previous = (baseline or {}).get("results", {}).get(name)
+        if previous and previous["median_ms"]:
+            ratio = result["median_ms"] / previous["median_ms"]
+            line += f"  x{ratio:.2f} ({previous['queries']} queries before)"
+        return line
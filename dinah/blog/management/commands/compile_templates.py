@@ -0,0 +1,40 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.template import engines
+from mako.exceptions import MakoException
+
+
+class Command(BaseCommand):
+    help = "Compile every Mako template into the module directory ahead of time"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--engine", default="mako", help="alias of the Mako template engine"
+        )
+
+    def handle(self, *args, **options):
+        lookup = engines[options["engine"]].engine.lookup
+        if not lookup.module_directory:
+            raise CommandError("the Mako engine has no module_directory configured")
+
+        compiled = 0
+        for directory in lookup.directories:
+            for root, _, files in os.walk(directory):
+                for filename in sorted(files):
+                    if not filename.endswith(".mako"):
+                        continue
+                    uri = os.path.relpath(os.path.join(root, filename), directory)
+                    try:
+                        # the lookup writes the module next to the others and reuses it afterwards
+                        lookup.get_template(uri.replace(os.sep, "/"))
+                    except MakoException as exc:
+                        raise CommandError(f"failed to compile {uri}: {exc}")
+                    compiled += 1
+                    self.stdout.write(f"compiled {uri}")
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"done, {compiled} templates compiled into {lookup.module_directory}"
+            )
+        )
@@ -0,0 +1,114 @@
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django import db
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from blog.export import (
+    export_pages,
+    load_manifest,
+    save_manifest,
+    site_pages,
+    site_state,
+    stale_pages,
+)
+
+
+def _close_connections():
+    # NOTE: forked workers must open their own database connections
+    db.connections.close_all()
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class Command(BaseCommand):
+    help = (
+        "Render every public page to static HTML files: `/` to index.html, `/post/1` "
+        "to post/1.html and listing pages reached with `?after=<token>` to "
+        "<path>/page/<token>.html, the links to them are rewritten to match"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output",
+            default=settings.STATIC_EXPORT_ROOT,
+            help="directory the pages are written to",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count(),
+            help="size of the process pool",
+        )
+        parser.add_argument(
+            "--chunk-size", type=int, default=200, help="pages rendered per task"
+        )
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help=(
+                "only re-render pages changed since the last export, per its manifest; "
+                "deleted comments are not noticed"
+            ),
+        )
+
+    def handle(self, *args, **options):
+        root = os.path.abspath(options["output"])
+        os.makedirs(root, exist_ok=True)
+
+        started = timezone.now()
+        # the page list is built up front so workers never share the parent's cursor
+        pages = list(site_pages())
+        state = site_state()
+        manifest = load_manifest(root)
+        if options["incremental"] and manifest is not None:
+            todo = stale_pages(pages, manifest, state)
+            entries = manifest["pages"]
+        else:
+            todo = pages
+            entries = {}
+        chunks = list(_chunks(todo, options["chunk_size"]))
+        _close_connections()
+
+        with ProcessPoolExecutor(
+            max_workers=options["workers"], initializer=_close_connections
+        ) as executor:
+            futures = [executor.submit(export_pages, root, chunk) for chunk in chunks]
+            for future in futures:
+                entries.update(future.result())
+                self.stdout.write(f"exported {len(entries)} pages")
+
+        removed = self.remove_gone_pages(root, pages, manifest, entries)
+        save_manifest(
+            root, {"exported_at": started.isoformat(), "pages": entries, **state}
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"done, {len(todo)} of {len(pages)} pages rendered, {removed} removed, "
+                f"written to {root}"
+            )
+        )
+
+    @staticmethod
+    def remove_gone_pages(root, pages, manifest, entries) -> int:
+        current = {page.filename for page in pages}
+        exported = set(entries) | set(manifest["pages"] if manifest else ())
+        removed = 0
+        for filename in exported - current:
+            entries.pop(filename, None)
+            try:
+                os.remove(os.path.join(root, filename))
+            except FileNotFoundError:
+                continue
+            removed += 1
+        return removed
@@ -0,0 +1,80 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from blog.importing import PostImporter, check_name, parse_post, read_sources
+from blog.models import Category
+
+
+class Command(BaseCommand):
+    help = (
+        "Import posts from a directory or a tarball of Markdown files with front matter"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="directory or tarball (.tar, .tar.gz, ...)")
+        parser.add_argument(
+            "--owner", required=True, help="username the imported posts belong to"
+        )
+        parser.add_argument(
+            "--category",
+            default="默认",
+            help="category of posts whose front matter names none",
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=1000, help="posts inserted per batch"
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count(),
+            help="size of the process pool rendering the Markdown",
+        )
+        parser.add_argument(
+            "--no-render",
+            action="store_true",
+            help="leave the HTML to a later, parallel `render_posts` run",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            owner = User.objects.get(username=options["owner"])
+        except User.DoesNotExist:
+            raise CommandError(f"no such user: {options['owner']}")
+        try:
+            check_name(Category, options["category"])
+        except ValueError as e:
+            raise CommandError(f"--category: {e}")
+        render = not options["no_render"]
+        executor = None
+        if render and options["workers"] > 1:
+            executor = ProcessPoolExecutor(max_workers=options["workers"])
+        importer = PostImporter(
+            owner,
+            options["category"],
+            render=render,
+            batch_size=options["batch_size"],
+            executor=executor,
+        )
+
+        def records():
+            for name, text in read_sources(options["path"]):
+                try:
+                    yield parse_post(name, text)
+                except ValueError as e:
+                    raise CommandError(f"{name}: {e}")
+
+        started = time.monotonic()
+        try:
+            total = importer.import_records(records())
+        finally:
+            importer.finish()
+            if executor is not None:
+                executor.shutdown()
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            self.style.SUCCESS(f"done, {total} posts imported in {elapsed:.1f}s")
+        )
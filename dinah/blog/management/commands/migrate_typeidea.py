@@ -0,0 +1,106 @@
+import json
+import os
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.db.utils import load_backend
+
+from blog.counts import recount_posts
+from blog.hotness import seed_from_pv
+from blog.legacy import LEGACY_TABLES, copy_rows, read_rows
+from blog.models import Post
+
+LEGACY_ALIAS = "typeidea"
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy a legacy typeidea database into the blog, keeping ids, in resumable "
+        "batches"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "source",
+            help="alias of the legacy database in DATABASES, or the path of its SQLite file",
+        )
+        parser.add_argument(
+            "--checkpoint",
+            default=".typeidea-checkpoint.json",
+            help="file recording the last copied id of every table, to resume from",
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=1000, help="rows copied per transaction"
+        )
+
+    def handle(self, *args, **options):
+        source = self.connect(options["source"])
+        try:
+            self.copy(source, options)
+        finally:
+            source.close()
+
+    def copy(self, source, options):
+        checkpoint_path = options["checkpoint"]
+        checkpoint = self.load_checkpoint(checkpoint_path)
+        # NOTE: rows keep their ids, an existing user would replace a legacy one
+        if not checkpoint and (Post.objects.exists() or User.objects.exists()):
+            raise CommandError(
+                "the blog already has users or posts, migrate into an empty database "
+                "(before createsuperuser) or pass the --checkpoint of an interrupted run"
+            )
+
+        for table in LEGACY_TABLES:
+            total = 0
+            after = checkpoint.get(table.name, 0)
+            for rows in read_rows(source, table, after, options["batch_size"]):
+                try:
+                    checkpoint[table.name] = copy_rows(table, rows)
+                except ValueError as e:
+                    raise CommandError(f"{table.name} #{rows[0]['id']}: {e}")
+                self.save_checkpoint(checkpoint_path, checkpoint)
+                total += len(rows)
+            self.stdout.write(f"{table.name}: {total} rows copied")
+
+        # explicit ids leave the sequences behind on backends that have them
+        models = [table.model for table in LEGACY_TABLES]
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), models):
+                cursor.execute(sql)
+        recount_posts()
+        # NOTE: typeidea kept no view counts, only posts given some since are ranked
+        seed_from_pv()
+        # nothing cached describes the copied content
+        cache.clear()
+        self.stdout.write(self.style.SUCCESS("done"))
+
+    def connect(self, source: str):
+        if source in connections.databases and source != DEFAULT_DB_ALIAS:
+            return connections[source]
+        if not os.path.isfile(source):
+            raise CommandError(f"no database alias or SQLite file named {source}")
+        engine = "django.db.backends.sqlite3"
+        settings_dict = {
+            **connections[DEFAULT_DB_ALIAS].settings_dict,
+            "ENGINE": engine,
+            "NAME": source,
+        }
+        return load_backend(engine).DatabaseWrapper(settings_dict, LEGACY_ALIAS)
+
+    @staticmethod
+    def load_checkpoint(path: str) -> dict:
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    @staticmethod
+    def save_checkpoint(path: str, checkpoint: dict):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp_path, path)
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from blog import search
+from blog.models import Post
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index of posts"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=500, help="posts indexed per batch"
+        )
+
+    def handle(self, *args, **options):
+        if not search.is_available():
+            raise CommandError("full-text search needs the SQLite FTS5 backend")
+        batch_size = options["batch_size"]
+        qs = Post.objects.only("title", "desc", "content", "status").order_by("id")
+
+        total = 0
+        last_id = 0
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(f"DELETE FROM {search.FTS_TABLE}")
+            while True:
+                posts = list(qs.filter(id__gt=last_id)[:batch_size])
+                if not posts:
+                    break
+                last_id = posts[-1].id
+                search.index_posts(posts)
+                total += len(posts)
+        self.stdout.write(self.style.SUCCESS(f"done, {total} posts indexed"))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from blog.hotness import refresh_hotness
+
+
+class Command(BaseCommand):
+    help = (
+        "Fold the page views of recent hours into the hot posts ranking, "
+        "run it every minute from cron or a systemd timer"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=500, help="view buckets ranked per batch"
+        )
+
+    def handle(self, *args, **options):
+        total = refresh_hotness(options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"done, {total} posts ranked"))
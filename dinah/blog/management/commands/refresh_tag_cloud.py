@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from blog.tagcloud import refresh_tag_cloud
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the tag cloud weights from the published post counts, "
+        "run it every few minutes from cron or a systemd timer"
+    )
+
+    def handle(self, *args, **options):
+        changed = refresh_tag_cloud()
+        self.stdout.write(
+            self.style.SUCCESS("done, tag cloud changed" if changed else "done")
+        )
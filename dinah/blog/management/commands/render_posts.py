@@ -0,0 +1,98 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from blog import pagecache
+from blog.cache import CONTENT_VERSION, SIDEBAR_VERSION, bump_version, touch_version
+from blog.models import Post
+from blog.rendering import RENDERER_VERSION, render_post
+
+
+def invalidate(post_ids):
+    """What the save signals skipped by `bulk_update()` would have invalidated."""
+    posts = Post.objects.filter(id__in=post_ids)
+    category_ids = set(posts.values_list("category_id", flat=True))
+    tag_ids = set(
+        Post.tag.through.objects.filter(post_id__in=post_ids).values_list(
+            "tag_id", flat=True
+        )
+    )
+    pagecache.purge(
+        pagecache.LATEST_POSTS,
+        pagecache.SIDEBARS,
+        *map(pagecache.post_dep, post_ids),
+        *map(pagecache.category_posts_dep, category_ids),
+        *map(pagecache.tag_posts_dep, tag_ids),
+    )
+    bump_version(SIDEBAR_VERSION)
+    touch_version(CONTENT_VERSION)
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-render the Markdown of posts whose HTML is older than the current renderer"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="re-render every post, not only stale ones",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count(),
+            help="size of the process pool",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="posts fetched and updated per batch",
+        )
+
+    def handle(self, *args, **options):
+        qs = Post.objects.order_by("id")
+        if not options["all"]:
+            qs = qs.exclude(render_version=RENDERER_VERSION)
+        batch_size = options["batch_size"]
+
+        total = 0
+        last_id = 0
+        with ProcessPoolExecutor(max_workers=options["workers"]) as executor:
+            while True:
+                rows = list(
+                    qs.filter(id__gt=last_id).values_list("id", "content", "desc")[
+                        :batch_size
+                    ]
+                )
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+                chunksize = max(1, len(rows) // (options["workers"] * 4))
+                posts = [
+                    Post(
+                        id=post_id,
+                        content_html=content_html,
+                        desc_html=desc_html,
+                        render_version=RENDERER_VERSION,
+                    )
+                    for post_id, content_html, desc_html in executor.map(
+                        render_post, rows, chunksize=chunksize
+                    )
+                ]
+                with transaction.atomic():
+                    Post.objects.bulk_update(
+                        posts, ["content_html", "desc_html", "render_version"]
+                    )
+                    post_ids = [post.id for post in posts]
+                    transaction.on_commit(
+                        lambda post_ids=post_ids: invalidate(post_ids)
+                    )
+                total += len(posts)
+                self.stdout.write(f"rendered {total} posts")
+
+        self.stdout.write(self.style.SUCCESS(f"done, {total} posts rendered"))
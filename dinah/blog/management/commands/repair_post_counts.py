@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from blog.counts import recount_posts
+
+
+class Command(BaseCommand):
+    help = "Recompute the published post counts of categories and tags"
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            recount_posts()
+        self.stdout.write(self.style.SUCCESS("done"))
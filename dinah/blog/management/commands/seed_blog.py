@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from blog.models import Post
+from blog.synthetic import SyntheticBlog, dataset_shape
+
+
+class Command(BaseCommand):
+    help = "Fill an empty database with a synthetic blog, for benchmarks"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--posts", type=int, default=1000, help="number of posts, 1k to 1M"
+        )
+        parser.add_argument(
+            "--seed", type=int, default=0, help="same seed and size, same rows"
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=1000, help="posts inserted per batch"
+        )
+
+    def handle(self, *args, **options):
+        if Post.objects.exists():
+            raise CommandError("the database already has posts, seed an empty one")
+        shape = dataset_shape(options["posts"])
+        self.stdout.write(
+            f"seeding {options['posts']} posts, {shape['categories']} categories "
+            f"and {shape['tags']} tags"
+        )
+        blog = SyntheticBlog(options["posts"], options["seed"], options["batch_size"])
+        counts = blog.generate()
+        summary = ", ".join(f"{count} {kind}" for kind, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(f"done, {summary}"))
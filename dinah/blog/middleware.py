@@ -0,0 +1,66 @@
+import time
+import uuid
+from contextlib import ExitStack
+
+from django.db import connections
+from django.urls import Resolver404, resolve
+
+from utils.instrumentation import RequestStats, collecting, request_metrics
+from utils.metrics import process_metrics
+
+USER_KEY = "uid"
+TEN_YEARS = 60 * 60 * 24 * 365 * 10
+
+
+class UserIDMiddleware:
+    """Tag every visitor with a long-lived `uid` cookie, exposed as `request.uid`."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        uid = request.COOKIES.get(USER_KEY)
+        is_new = not uid
+        if is_new:
+            uid = uuid.uuid4().hex
+        request.uid = uid
+        response = self.get_response(request)
+        if is_new:
+            response.set_cookie(USER_KEY, uid, max_age=TEN_YEARS, httponly=True)
+        return response
+
+
+class InstrumentationMiddleware:
+    """Record wall time, queries, template rendering and size of every request.
+
+    Requests are grouped by URL pattern in `request_metrics`. Put it first, so
+    that the time includes the other middleware and page cache hits.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = RequestStats()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(stats.execute_wrapper))
+            stack.enter_context(collecting(stats))
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+        size = None if response.streaming else len(response.content)
+        request_metrics.record(self._route(request), duration, stats, size)
+        process_metrics.maybe_flush()
+        return response
+
+    @staticmethod
+    def _route(request) -> str:
+        match = request.resolver_match
+        if match is None:
+            # NOTE: answered before URL resolution, e.g. by the page cache
+            try:
+                match = resolve(request.path_info)
+            except Resolver404:
+                return "<unmatched>"
+        return f"/{match.route}"
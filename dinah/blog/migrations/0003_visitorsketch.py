@@ -0,0 +1,48 @@
+# Generated by Django 2.2 on 2026-10-18 13:21
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("blog", "0002_auto_20200406_2127"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="VisitorSketch",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "day",
+                    models.DateField(
+                        help_text="为空时为全部时间的访客", null=True, verbose_name="日期"
+                    ),
+                ),
+                ("sketch", models.BinaryField(verbose_name="HyperLogLog")),
+                (
+                    "post",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="blog.Post",
+                        verbose_name="文章",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "访客统计",
+                "verbose_name_plural": "访客统计",
+                "unique_together": {("post", "day")},
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 2.2 on 2026-10-18 13:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("blog", "0003_visitorsketch"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="post",
+            name="content_html",
+            field=models.TextField(blank=True, editable=False, verbose_name="正文HTML"),
+        ),
+        migrations.AddField(
+            model_name="post",
+            name="desc_html",
+            field=models.TextField(blank=True, editable=False, verbose_name="简要HTML"),
+        ),
+        migrations.AddField(
+            model_name="post",
+            name="render_version",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
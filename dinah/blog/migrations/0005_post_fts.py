@@ -0,0 +1,71 @@
+import re
+
+from django.db import migrations
+
+# NOTE: a copy of blog.search as of this migration, later changes to the
+# search code must not change what this migration does
+
+FTS_TABLE = "blog_post_fts"
+
+_CJK = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff"
+_TOKEN_RE = re.compile(rf"[{_CJK}]+|[^\W_{_CJK}]+")
+_CJK_RE = re.compile(rf"[{_CJK}]")
+
+
+def index_text(text):
+    tokens = []
+    for run in _TOKEN_RE.findall(text or ""):
+        if _CJK_RE.match(run):
+            if len(run) == 1:
+                tokens.append(run)
+            else:
+                tokens.extend(run[i : i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run.lower())
+    return " ".join(tokens)
+
+
+def forwards(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != "sqlite":
+        return
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+        "USING fts5(title, desc, content, status UNINDEXED, tokenize='unicode61')"
+    )
+    Post = apps.get_model("blog", "Post")
+    posts = Post.objects.using(connection.alias).only(
+        "title", "desc", "content", "status"
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT INTO {FTS_TABLE} (rowid, title, desc, content, status) "
+            "VALUES (%s, %s, %s, %s, %s)",
+            [
+                (
+                    post.id,
+                    index_text(post.title),
+                    index_text(post.desc),
+                    index_text(post.content),
+                    post.status,
+                )
+                for post in posts
+            ],
+        )
+
+
+def backwards(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("blog", "0004_post_content_html"),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
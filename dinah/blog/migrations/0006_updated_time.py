@@ -0,0 +1,46 @@
+# Generated by Django 2.2 on 2026-10-18 14:02
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("blog", "0005_post_fts"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="category",
+            name="updated_time",
+            field=models.DateTimeField(
+                auto_now=True, default=django.utils.timezone.now, verbose_name="更新时间",
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="post",
+            name="updated_time",
+            field=models.DateTimeField(
+                auto_now=True, default=django.utils.timezone.now, verbose_name="更新时间",
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="sidebar",
+            name="updated_time",
+            field=models.DateTimeField(
+                auto_now=True, default=django.utils.timezone.now, verbose_name="更新时间",
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="tag",
+            name="updated_time",
+            field=models.DateTimeField(
+                auto_now=True, default=django.utils.timezone.now, verbose_name="更新时间",
+            ),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,99 @@
+# Generated by Django 2.2 on 2026-10-18 13:33
+
+import math
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# NOTE: a copy of blog.hotness.view_score with HOT_HALF_LIFE as of this migration,
+# later changes to either must not change what this migration does
+HOT_HALF_LIFE = 60 * 60 * 24
+
+
+def view_score(views, period):
+    return math.log2(views) + period.timestamp() / HOT_HALF_LIFE
+
+
+def seed_hot_posts(apps, schema_editor):
+    # existing page views have no time, count them at the time the post was created
+    Post = apps.get_model("blog", "Post")
+    HotPost = apps.get_model("blog", "HotPost")
+    HotPost.objects.bulk_create(
+        HotPost(post_id=post_id, score=view_score(pv, created_time))
+        for post_id, pv, created_time in Post.objects.filter(pv__gt=0)
+        .values_list("id", "pv", "created_time")
+        .iterator()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("blog", "0006_updated_time"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="HotPost",
+            fields=[
+                (
+                    "post",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="hotness",
+                        serialize=False,
+                        to="blog.Post",
+                        verbose_name="文章",
+                    ),
+                ),
+                (
+                    "score",
+                    models.FloatField(
+                        help_text="按时间衰减的浏览量, 以2为底的对数", verbose_name="热度"
+                    ),
+                ),
+            ],
+            options={"verbose_name": "热门文章", "verbose_name_plural": "热门文章",},
+        ),
+        migrations.CreateModel(
+            name="PostViewBucket",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "period",
+                    models.DateTimeField(help_text="所在小时的开始时间", verbose_name="时段"),
+                ),
+                ("views", models.PositiveIntegerField(default=0, verbose_name="浏览量")),
+                (
+                    "ranked_views",
+                    models.PositiveIntegerField(default=0, verbose_name="已计入热度的浏览量"),
+                ),
+                (
+                    "post",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="blog.Post",
+                        verbose_name="文章",
+                    ),
+                ),
+            ],
+            options={"verbose_name": "浏览量分段", "verbose_name_plural": "浏览量分段",},
+        ),
+        migrations.AddIndex(
+            model_name="hotpost",
+            index=models.Index(fields=["-score"], name="blog_hotpost_score_idx"),
+        ),
+        migrations.AlterUniqueTogether(
+            name="postviewbucket", unique_together={("post", "period")},
+        ),
+        migrations.RunPython(seed_hot_posts, migrations.RunPython.noop),
+    ]
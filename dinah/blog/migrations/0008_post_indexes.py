@@ -0,0 +1,38 @@
+# Generated by Django 2.2 on 2026-10-18 13:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("blog", "0007_hot_posts"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="post",
+            index=models.Index(
+                condition=models.Q(status=1),
+                fields=["status", "-id"],
+                name="blog_post_normal_id_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="post",
+            index=models.Index(
+                condition=models.Q(status=1),
+                fields=["category", "status", "-id"],
+                name="blog_post_category_id_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="post",
+            index=models.Index(fields=["owner", "id"], name="blog_post_owner_id_idx"),
+        ),
+        # tag listings walk the auto-created through table from the tag side
+        migrations.RunSQL(
+            "CREATE INDEX blog_post_tag_tag_post_idx ON blog_post_tag (tag_id, post_id)",
+            "DROP INDEX blog_post_tag_tag_post_idx",
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 2.2 on 2026-10-18 13:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def existing_as_roots(apps, schema_editor):
+    Comment = apps.get_model("blog", "Comment")
+    Comment.objects.update(root_id=models.F("id"), path="")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("blog", "0008_post_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="comment",
+            name="parent",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="replies",
+                to="blog.Comment",
+                verbose_name="回复的评论",
+            ),
+        ),
+        migrations.AddField(
+            model_name="comment",
+            name="path",
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name="comment",
+            name="root_id",
+            field=models.PositiveIntegerField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="comment",
+            index=models.Index(
+                fields=["target", "root_id", "path"], name="blog_comment_thread_idx"
+            ),
+        ),
+        migrations.RunPython(existing_as_roots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 2.2 on 2026-10-18 13:46
+
+from django.db import migrations, models
+
+
+def count_posts(apps, schema_editor):
+    Post = apps.get_model("blog", "Post")
+    for model_name, field in (("Category", "category"), ("Tag", "tag")):
+        model = apps.get_model("blog", model_name)
+        rows = (
+            Post.objects.filter(status=1)
+            .order_by()
+            .values_list(field)
+            .annotate(count=models.Count("id"))
+        )
+        for pk, count in rows:
+            model.objects.filter(pk=pk).update(post_count=count)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("blog", "0009_comment_threads"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="category",
+            name="post_count",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="文章数量"
+            ),
+        ),
+        migrations.AddField(
+            model_name="tag",
+            name="post_count",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="文章数量"
+            ),
+        ),
+        migrations.RunPython(count_posts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 2.2 on 2026-10-18 13:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("blog", "0010_post_counts"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="tag",
+            name="weight",
+            field=models.PositiveSmallIntegerField(
+                default=0, editable=False, help_text="由文章数量定期计算", verbose_name="标签云字号"
+            ),
+        ),
+        migrations.AlterField(
+            model_name="sidebar",
+            name="display_type",
+            field=models.PositiveIntegerField(
+                choices=[
+                    (1, "HTML"),
+                    (2, "最新文章"),
+                    (3, "最热文章"),
+                    (4, "最近评论"),
+                    (5, "标签云"),
+                ],
+                default=1,
+                verbose_name="展示类型",
+            ),
+        ),
+    ]
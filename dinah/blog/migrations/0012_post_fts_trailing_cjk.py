@@ -0,0 +1,65 @@
+import re
+
+from django.db import migrations
+
+# NOTE: a copy of blog.search as of this migration, later changes to the
+# search code must not change what this migration does
+
+FTS_TABLE = "blog_post_fts"
+
+_CJK = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff"
+_TOKEN_RE = re.compile(rf"[{_CJK}]+|[^\W_{_CJK}]+")
+_CJK_RE = re.compile(rf"[{_CJK}]")
+
+
+def index_text(text):
+    tokens = []
+    for run in _TOKEN_RE.findall(text or ""):
+        if _CJK_RE.match(run):
+            if len(run) == 1:
+                tokens.append(run)
+            else:
+                tokens.extend(run[i : i + 2] for i in range(len(run) - 1))
+                tokens.append(run[-1])
+        else:
+            tokens.append(run.lower())
+    return " ".join(tokens)
+
+
+def reindex(apps, schema_editor):
+    """Index the trailing character of CJK runs, for one-character queries."""
+    connection = schema_editor.connection
+    if connection.vendor != "sqlite":
+        return
+    Post = apps.get_model("blog", "Post")
+    posts = Post.objects.using(connection.alias).only(
+        "title", "desc", "content", "status"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        cursor.executemany(
+            f"INSERT INTO {FTS_TABLE} (rowid, title, desc, content, status) "
+            "VALUES (%s, %s, %s, %s, %s)",
+            [
+                (
+                    post.id,
+                    index_text(post.title),
+                    index_text(post.desc),
+                    index_text(post.content),
+                    post.status,
+                )
+                for post in posts
+            ],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("blog", "0011_tag_cloud"),
+    ]
+
+    operations = [
+        # the old index still answers the old queries, nothing to undo
+        migrations.RunPython(reindex, migrations.RunPython.noop),
+    ]
@@ -1,13 +1,25 @@
 import dataclasses
-from typing import List, Optional, Dict, Any
+import datetime
+from typing import List, Optional, Dict, Any, NamedTuple, Tuple
 
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.db import models
-from django.db.models import QuerySet
+from django.db.models import Q, QuerySet
 from django.template.loader import render_to_string
 
+from blog.cache import CATEGORY_VERSION, bump_version, get_version, sidebar_cache_key
+from blog.counters import pv_buffer
+from blog.hll import HyperLogLog
+from blog.recent import recent_comments
+from blog.rendering import RENDERER_VERSION, render_post
+from utils.metrics import count_cache
+from utils.pagination import KeysetPage, paginate_by_keys
 from utils.shortcuts import render_mako_to_string
 
+DISPLAY_TAGS = 5
+
 DISPLAY_COMMENT = 4
 
 DISPLAY_HOT = 3
@@ -29,8 +41,12 @@ class Category(models.Model):
         default=STATUS_NORMAL, choices=STATUS, verbose_name="状态",
     )
     is_nav = models.BooleanField(default=False, verbose_name="是否为导航")
+    post_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name="文章数量"
+    )
     owner = models.ForeignKey(User, verbose_name="作者", on_delete=models.CASCADE)
     created_time = models.DateTimeField(auto_now_add=True, verbose_name="创建时间")
+    updated_time = models.DateTimeField(auto_now=True, verbose_name="更新时间")
 
     class Meta:
         verbose_name = verbose_name_plural = "分类"
@@ -38,24 +54,53 @@ class Category(models.Model):
     def __str__(self):
         return self.name
 
-    @dataclasses.dataclass
+    class NavItem(NamedTuple):
+        id: int
+        name: str
+
+    @dataclasses.dataclass(frozen=True)
     class NavsInfo:
-        navs: List["Category"]
-        categories: List["Category"]
+        navs: Tuple["Category.NavItem", ...]
+        categories: Tuple["Category.NavItem", ...]
+
+        def as_context(self) -> Dict[str, Any]:
+            return {"navs": self.navs, "categories": self.categories}
+
+    # (version, snapshot) shared by every request of this process
+    _navs_snapshot: Optional[Tuple[int, NavsInfo]] = None
 
     @staticmethod
     def get_navs() -> NavsInfo:
-        categories: QuerySet = Category.objects.filter(status=Category.STATUS_NORMAL)
-        # nav_categories = categories.filter(is_nav=True)
-        # normal_categories = categories.filter(is_nav=False)
-        nav_categories: List[Category] = []
-        normal_categories: List[Category] = []
-        for c in categories:
-            if c.is_nav:
-                nav_categories.append(c)
+        version = get_version(CATEGORY_VERSION)
+        snapshot = Category._navs_snapshot
+        is_fresh = snapshot is not None and snapshot[0] == version
+        count_cache("navs", hit=is_fresh)
+        if not is_fresh:
+            snapshot = (version, Category.build_navs())
+            Category._navs_snapshot = snapshot
+        return snapshot[1]
+
+    @staticmethod
+    def build_navs() -> NavsInfo:
+        rows = Category.objects.filter(status=Category.STATUS_NORMAL).values_list(
+            "id", "name", "is_nav"
+        )
+        nav_categories: List[Category.NavItem] = []
+        normal_categories: List[Category.NavItem] = []
+        for id_, name, is_nav in rows:
+            item = Category.NavItem(id_, name)
+            if is_nav:
+                nav_categories.append(item)
             else:
-                normal_categories.append(c)
-        return Category.NavsInfo(navs=nav_categories, categories=normal_categories,)
+                normal_categories.append(item)
+        return Category.NavsInfo(
+            navs=tuple(nav_categories), categories=tuple(normal_categories),
+        )
+
+    @staticmethod
+    def invalidate_navs():
+        Category._navs_snapshot = None
+        bump_version(CATEGORY_VERSION)
 
 
 class Tag(models.Model):
@@ -69,8 +114,15 @@ class Tag(models.Model):
     status = models.PositiveIntegerField(
         default=STATUS_NORMAL, choices=STATUS, verbose_name="状态",
     )
+    post_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name="文章数量"
+    )
+    weight = models.PositiveSmallIntegerField(
+        default=0, editable=False, verbose_name="标签云字号", help_text="由文章数量定期计算"
+    )
     owner = models.ForeignKey(User, verbose_name="作者", on_delete=models.CASCADE)
     created_time = models.DateTimeField(auto_now_add=True, verbose_name="创建时间")
+    updated_time = models.DateTimeField(auto_now=True, verbose_name="更新时间")
 
     class Meta:
         verbose_name = verbose_name_plural = "标签"
@@ -79,6 +131,76 @@ class Tag(models.Model):
         return self.name
 
 
+class PostSummary:
+    """What listings show of a post, without its content."""
+
+    class TagItem(NamedTuple):
+        id: int
+        name: str
+
+    COLUMNS = (
+        "id",
+        "title",
+        "desc",
+        "desc_html",
+        "created_time",
+        "category_id",
+        "category__name",
+        "owner__username",
+    )
+    __slots__ = (
+        "id",
+        "title",
+        "desc",
+        "desc_html",
+        "created_time",
+        "category_id",
+        "category_name",
+        "owner_name",
+        "tags",
+    )
+
+    def __init__(
+        self,
+        id,
+        title,
+        desc,
+        desc_html,
+        created_time,
+        category_id,
+        category_name,
+        owner_name,
+    ):
+        self.id = id
+        self.title = title
+        self.desc = desc
+        self.desc_html = desc_html
+        self.created_time = created_time
+        self.category_id = category_id
+        self.category_name = category_name
+        self.owner_name = owner_name
+        self.tags: List[PostSummary.TagItem] = []
+
+    def __repr__(self):
+        return f"<PostSummary: {self.id} {self.title}>"
+
+    @classmethod
+    def from_rows(cls, rows) -> List["PostSummary"]:
+        """Summaries of `Post.summarize()` rows, with their tags in one query."""
+        rows = {row[0]: cls(*row) for row in rows}
+        if rows:
+            tags = (
+                Post.tag.through.objects.filter(
+                    post_id__in=list(rows), tag__status=Tag.STATUS_NORMAL
+                )
+                .order_by("tag_id")
+                .values_list("post_id", "tag_id", "tag__name")
+            )
+            for post_id, tag_id, name in tags:
+                rows[post_id].tags.append(cls.TagItem(tag_id, name))
+        return list(rows.values())
+
+
 class Post(models.Model):
     STATUS_NORMAL = 1
     STATUS_DELETE = 0
@@ -93,6 +215,9 @@ class Post(models.Model):
     title = models.CharField(max_length=255, verbose_name="标题",)
     desc = models.CharField(max_length=1024, verbose_name="简要",)
     content = models.TextField(verbose_name="正文", help_text="正文使用MarkDown语法标注")
+    content_html = models.TextField(verbose_name="正文HTML", blank=True, editable=False)
+    desc_html = models.TextField(verbose_name="简要HTML", blank=True, editable=False)
+    render_version = models.PositiveIntegerField(default=0, editable=False)
     status = models.PositiveIntegerField(
         default=STATUS_NORMAL, choices=STATUS, verbose_name="状态",
     )
@@ -100,22 +225,75 @@ class Post(models.Model):
     tag = models.ManyToManyField(Tag, verbose_name="标签")
     owner = models.ForeignKey(User, verbose_name="作者", on_delete=models.CASCADE)
     created_time = models.DateTimeField(auto_now_add=True, verbose_name="创建时间")
+    updated_time = models.DateTimeField(auto_now=True, verbose_name="更新时间")
 
     class Meta:
         verbose_name = verbose_name_plural = "文章"
         ordering = ["-id"]
+        # NOTE: the public listings only ever read published posts, partial indexes keep them small
+        indexes = [
+            models.Index(
+                fields=["status", "-id"],
+                name="blog_post_normal_id_idx",
+                condition=Q(status=1),
+            ),
+            models.Index(
+                fields=["category", "status", "-id"],
+                name="blog_post_category_id_idx",
+                condition=Q(status=1),
+            ),
+            models.Index(fields=["owner", "id"], name="blog_post_owner_id_idx"),
+        ]
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or {"content", "desc"} & set(update_fields):
+            self.render()
+            if update_fields is not None:
+                kwargs["update_fields"] = set(update_fields) | {
+                    "content_html",
+                    "desc_html",
+                    "render_version",
+                }
+        return super().save(*args, **kwargs)
+
+    def render(self):
+        _, self.content_html, self.desc_html = render_post(
+            (self.id, self.content, self.desc)
+        )
+        self.render_version = RENDERER_VERSION
+
+    def get_uv(self, day: datetime.date = None) -> int:
+        """Unique visitors estimated from the stored and the buffered sketches."""
+        rows = VisitorSketch.objects.filter(post_id=self.id)
+        rows = rows.filter(day=day) if day else rows.filter(day__isnull=True)
+        sketch = pv_buffer.pending_visitors(self.id, day)
+        for data in rows.values_list("sketch", flat=True):
+            sketch.merge(HyperLogLog.from_bytes(data))
+        return sketch.count()
+
+    @staticmethod
+    def summarize(posts: QuerySet) -> QuerySet:
+        """The same posts as named rows of the `PostSummary.COLUMNS` only.
+
+        Pass them through `PostSummary.from_rows()` when the tags are shown.
+        """
+        return posts.values_list(*PostSummary.COLUMNS, named=True)
+
     @staticmethod
     def hot_posts() -> QuerySet:
-        return Post.objects.filter(status=Post.STATUS_NORMAL).order_by("-pv")
+        """Published posts by time-decayed hotness, read from the `HotPost` ranking."""
+        return Post.objects.filter(
+            status=Post.STATUS_NORMAL, hotness__isnull=False
+        ).order_by("-hotness__score")
 
     @staticmethod
     def get_by_tag(tag_id: int) -> (List["Post"], Optional[Tag]):
         tag = None
-        posts = []
+        posts = Post.objects.none()
         if tag_id:
             try:
                 tag = Tag.objects.get(id=tag_id)
@@ -146,6 +324,51 @@ class Post(models.Model):
         return qs
 
 
+class PostViewBucket(models.Model):
+    post = models.ForeignKey(Post, verbose_name="文章", on_delete=models.CASCADE)
+    period = models.DateTimeField(verbose_name="时段", help_text="所在小时的开始时间")
+    views = models.PositiveIntegerField(default=0, verbose_name="浏览量")
+    ranked_views = models.PositiveIntegerField(default=0, verbose_name="已计入热度的浏览量")
+
+    class Meta:
+        verbose_name = verbose_name_plural = "浏览量分段"
+        unique_together = ("post", "period")
+
+    def __str__(self):
+        return f"{self.post_id}@{self.period}"
+
+
+class HotPost(models.Model):
+    post = models.OneToOneField(
+        Post,
+        primary_key=True,
+        related_name="hotness",
+        verbose_name="文章",
+        on_delete=models.CASCADE,
+    )
+    score = models.FloatField(verbose_name="热度", help_text="按时间衰减的浏览量, 以2为底的对数")
+
+    class Meta:
+        verbose_name = verbose_name_plural = "热门文章"
+        indexes = [models.Index(fields=["-score"], name="blog_hotpost_score_idx")]
+
+    def __str__(self):
+        return f"{self.post_id}: {self.score:.2f}"
+
+
+class VisitorSketch(models.Model):
+    post = models.ForeignKey(Post, verbose_name="文章", on_delete=models.CASCADE)
+    day = models.DateField(null=True, verbose_name="日期", help_text="为空时为全部时间的访客")
+    sketch = models.BinaryField(verbose_name="HyperLogLog")
+
+    class Meta:
+        verbose_name = verbose_name_plural = "访客统计"
+        unique_together = ("post", "day")
+
+    def __str__(self):
+        return f"{self.post_id}@{self.day or '*'}"
+
+
 class Link(models.Model):
     STATUS_NORMAL = 1
     STATUS_DELETE = 0
@@ -183,6 +406,7 @@ class SideBar(models.Model):
         (DISPLAY_LATEST, "最新文章"),
         (DISPLAY_HOT, "最热文章"),
         (DISPLAY_COMMENT, "最近评论"),
+        (DISPLAY_TAGS, "标签云"),
     )
     title = models.CharField(max_length=50, verbose_name="标题",)
     display_type = models.PositiveIntegerField(
@@ -196,6 +420,7 @@ class SideBar(models.Model):
     )
     owner = models.ForeignKey(User, verbose_name="作者", on_delete=models.CASCADE)
     created_time = models.DateTimeField(auto_now_add=True, verbose_name="创建时间")
+    updated_time = models.DateTimeField(auto_now=True, verbose_name="更新时间")
 
     class Meta:
         verbose_name = verbose_name_plural = "侧边栏"
@@ -209,17 +434,35 @@ class SideBar(models.Model):
 
     @property
     def content_html(self) -> str:
+        if self.display_type == DISPLAY_HTML:
+            return self.content
+        if self.display_type == DISPLAY_TAGS:
+            # cached on its own, refreshed in the background
+            from blog.tagcloud import tag_cloud_html
+
+            return tag_cloud_html()
+        key = sidebar_cache_key(self.id)
+        result = cache.get(key)
+        count_cache("sidebar", hit=result is not None)
+        if result is None:
+            result = self.render_content()
+            cache.set(key, result, settings.SIDEBAR_CACHE_TIMEOUT)
+        return result
+
+    def render_content(self) -> str:
         result = ""
         if self.display_type == DISPLAY_HTML:
             result = self.content
         elif self.display_type == DISPLAY_LATEST:
-            ctx = {"posts": Post.latest_post()}
+            posts = Post.summarize(Post.latest_post())
+            ctx = {"posts": posts[: settings.SIDEBAR_POST_COUNT]}
             result = render_mako_to_string("blocks/sidebar_posts.mako", context=ctx)
         elif self.display_type == DISPLAY_HOT:
-            ctx = {"posts": Post.hot_posts()}
+            posts = Post.summarize(Post.hot_posts())
+            ctx = {"posts": posts[: settings.SIDEBAR_POST_COUNT]}
             result = render_mako_to_string("blocks/sidebar_posts.mako", context=ctx)
-        elif self.display_type == DISPLAY_HOT:
-            ctx = {"comments": Comment.objects.filter(status=Comment.STATUS_NORMAL)}
+        elif self.display_type == DISPLAY_COMMENT:
+            ctx = {"comments": recent_comments.items()}
             result = render_mako_to_string("blocks/sidebar_comments.mako", context=ctx)
         return result
 
@@ -231,7 +474,22 @@ class Comment(models.Model):
         (STATUS_DELETE, "删除"),
         (STATUS_NORMAL, "正常"),
     )
+    # every comment below the root of its thread adds its id to `path` in
+    # fixed-width segments, so ordering by (root_id, path) is the display order
+    PATH_SEGMENT = 10
+    MAX_DEPTH = 255 // PATH_SEGMENT
+
     target = models.ForeignKey(Post, verbose_name="评论文章", on_delete=models.CASCADE)
+    parent = models.ForeignKey(
+        "self",
+        null=True,
+        blank=True,
+        related_name="replies",
+        verbose_name="回复的评论",
+        on_delete=models.CASCADE,
+    )
+    root_id = models.PositiveIntegerField(null=True, editable=False)
+    path = models.CharField(max_length=255, blank=True, editable=False)
     author = models.CharField(max_length=50, verbose_name="评论作者")
     content = models.CharField(max_length=2000, verbose_name="评论正文")
     home_site = models.URLField(verbose_name="主页")
@@ -243,3 +501,49 @@ class Comment(models.Model):
 
     class Meta:
         verbose_name = verbose_name_plural = "评论"
+        indexes = [
+            models.Index(
+                fields=["target", "root_id", "path"], name="blog_comment_thread_idx"
+            )
+        ]
+
+    def __str__(self):
+        return self.content[:20]
+
+    @property
+    def depth(self) -> int:
+        return len(self.path) // self.PATH_SEGMENT
+
+    def save(self, *args, **kwargs):
+        if self.parent_id:
+            self.target_id = self.parent.target_id
+        super().save(*args, **kwargs)
+        if self.root_id is None:
+            self.root_id, self.path = self.id, ""
+            if self.parent_id:
+                parent = self.parent
+                # too deep replies become siblings of their parent
+                base = parent.path
+                if parent.depth >= self.MAX_DEPTH:
+                    base = base[: -self.PATH_SEGMENT]
+                self.root_id = parent.root_id
+                self.path = f"{base}{self.id:0{self.PATH_SEGMENT}d}"
+            Comment.objects.filter(id=self.id).update(
+                root_id=self.root_id, path=self.path
+            )
+
+    def subtree(self) -> QuerySet:
+        """The comment and all replies below it, in display order."""
+        # NOTE: ":" sorts right after the digits, so this is a prefix match on the index
+        return Comment.objects.filter(
+            target_id=self.target_id,
+            root_id=self.root_id,
+            path__gte=self.path,
+            path__lt=f"{self.path}:",
+        ).order_by("path")
+
+    @staticmethod
+    def get_page(post_id: int, after: str = None, per_page: int = 20) -> KeysetPage:
+        """A page of the visible comments of a post, threads in display order."""
+        qs = Comment.objects.filter(target_id=post_id, status=Comment.STATUS_NORMAL)
+        return paginate_by_keys(qs, ("root_id", "path"), after, per_page)
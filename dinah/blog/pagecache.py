@@ -0,0 +1,168 @@
+import hashlib
+from typing import Iterable, List
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+
+from blog.cache import bump_version, get_versions
+from blog.counters import pv_buffer
+from utils.metrics import count_cache
+
+# dependency names shared by several pages
+LATEST_POSTS = "posts"
+SIDEBARS = "sidebars"
+NAVS = "navs"
+TAGS = "tags"
+
+
+def post_dep(post_id: int) -> str:
+    return f"post:{post_id}"
+
+
+def category_dep(category_id: int) -> str:
+    return f"category:{category_id}"
+
+
+def category_posts_dep(category_id: int) -> str:
+    return f"category-posts:{category_id}"
+
+
+def tag_dep(tag_id: int) -> str:
+    return f"tag:{tag_id}"
+
+
+def tag_posts_dep(tag_id: int) -> str:
+    return f"tag-posts:{tag_id}"
+
+
+def post_deps(post_id: int, category_id: int, tag_ids: Iterable[int]) -> List[str]:
+    """Dependencies of a page showing the post itself."""
+    return [
+        post_dep(post_id),
+        category_dep(category_id),
+        *[tag_dep(tag_id) for tag_id in tag_ids],
+    ]
+
+
+def post_listing_deps(category_id: int, tag_ids: Iterable[int]) -> List[str]:
+    """Dependencies of every listing page a post can appear on."""
+    return [
+        LATEST_POSTS,
+        category_posts_dep(category_id),
+        *[tag_posts_dep(tag_id) for tag_id in tag_ids],
+    ]
+
+
+def _dep_version(dep: str) -> str:
+    return f"page:{dep}"
+
+
+def depends_on(request, *deps: str):
+    """Declare what a page is rendered from, only such pages are cached.
+
+    Call it before reading the rows: the page is stored under the versions
+    of its dependencies at this point, so a purge while it renders makes
+    the stored copy stale instead of being lost.
+    """
+    if not hasattr(request, "page_deps"):
+        request.page_deps = set()
+        request.page_deps_versions = {}
+    new = set(deps) - request.page_deps
+    if not new:
+        return
+    request.page_deps.update(new)
+    request.page_deps_versions.update(get_versions(_dep_version(dep) for dep in new))
+
+
+def count_view(request, post_id: int):
+    """Count a post view, and keep counting it when the page is served from cache.
+
+    Internal renderings such as the static export set `request.count_views`
+    to False.
+    """
+    if not getattr(request, "count_views", True):
+        return
+    pv_buffer.incr(post_id, visitor=getattr(request, "uid", None))
+    if not hasattr(request, "page_views"):
+        request.page_views = []
+    request.page_views.append(post_id)
+
+
+def purge(*deps: str):
+    """Invalidate every cached page depending on any of `deps` once committed."""
+
+    def bump():
+        for dep in set(deps):
+            bump_version(_dep_version(dep))
+
+    transaction.on_commit(bump)
+
+
+def _cache_key(request) -> str:
+    url = f"{request.get_host()}{request.get_full_path()}"
+    return f"page:{hashlib.md5(url.encode()).hexdigest()}"
+
+
+def _is_cacheable_request(request) -> bool:
+    return request.method in ("GET", "HEAD") and not request.user.is_authenticated
+
+
+class PageCacheMiddleware:
+    """Full-page cache for anonymous readers.
+
+    A cached page stores the version of every dependency it declared through
+    `depends_on()`, a hit is served only while all of them are unchanged, so
+    `purge()` invalidates exactly the pages built from the changed rows.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not _is_cacheable_request(request):
+            return self.get_response(request)
+
+        key = _cache_key(request)
+        entry = cache.get(key)
+        if entry is not None:
+            versions = get_versions(_dep_version(dep) for dep in entry["deps"])
+            if versions == entry["deps_versions"]:
+                count_cache("page", hit=True)
+                for post_id in entry["views"]:
+                    pv_buffer.incr(post_id, visitor=getattr(request, "uid", None))
+                response = HttpResponse(
+                    entry["content"], content_type=entry["content_type"]
+                )
+                for header, value in entry.get("headers", {}).items():
+                    response[header] = value
+                response["X-Page-Cache"] = "hit"
+                return response
+
+        count_cache("page", hit=False)
+        response = self.get_response(request)
+        deps = getattr(request, "page_deps", None)
+        if (
+            deps
+            and response.status_code == 200
+            and not response.streaming
+            and not response.cookies
+            and not request.META.get("CSRF_COOKIE_USED")
+        ):
+            entry = {
+                "deps": sorted(deps),
+                "deps_versions": request.page_deps_versions,
+                "views": getattr(request, "page_views", []),
+                "content": response.content,
+                "content_type": response["Content-Type"],
+                # validators let ConditionalGetMiddleware answer 304 on cache hits
+                "headers": {
+                    header: response[header]
+                    for header in ("ETag", "Last-Modified")
+                    if response.has_header(header)
+                },
+            }
+            cache.set(key, entry, settings.PAGE_CACHE_TIMEOUT)
+            response["X-Page-Cache"] = "miss"
+        return response
@@ -0,0 +1,121 @@
+import datetime
+import threading
+from collections import deque
+from typing import Deque, List, NamedTuple, Optional
+
+from django.conf import settings
+from django.db import DatabaseError
+
+from blog.cache import COMMENTS_VERSION, bump_version, get_version
+
+
+class CommentItem(NamedTuple):
+    id: int
+    post_id: int
+    author: str
+    content: str
+    created_time: datetime.datetime
+
+
+class RecentComments:
+    """The latest visible comments, newest first, in a fixed-size ring buffer.
+
+    The process that saves or deletes a comment updates its buffer in place.
+    The others notice the bumped `COMMENTS_VERSION` and reload with a single
+    query, so reading the buffer costs no query while comments don't change.
+    """
+
+    EXCERPT_LENGTH = 100
+
+    def __init__(self, size: int = 10):
+        self.size = size
+        self._lock = threading.Lock()
+        self._entries: Optional[Deque[CommentItem]] = None
+        self._version = None
+
+    def items(self) -> List[CommentItem]:
+        version = get_version(COMMENTS_VERSION)
+        with self._lock:
+            if self._entries is None or version != self._version:
+                self._entries = self._load()
+                self._version = version
+            return list(self._entries)
+
+    def prefill(self):
+        """Load the buffer ahead of the first read."""
+        try:
+            self.items()
+        except DatabaseError:
+            # NOTE: not migrated yet, the first read loads it
+            pass
+
+    def _load(self) -> Deque[CommentItem]:
+        from blog.models import Comment
+
+        rows = (
+            Comment.objects.filter(status=Comment.STATUS_NORMAL)
+            .order_by("-id")
+            .values_list("id", "target_id", "author", "content", "created_time")
+        )
+        return deque((self._item(*row) for row in rows[: self.size]), maxlen=self.size)
+
+    def _item(self, id, post_id, author, content, created_time) -> CommentItem:
+        return CommentItem(
+            id, post_id, author, content[: self.EXCERPT_LENGTH], created_time
+        )
+
+    def saved(self, comment):
+        if comment.status != comment.STATUS_NORMAL:
+            self.deleted(comment)
+            return
+        item = self._item(
+            comment.id,
+            comment.target_id,
+            comment.author,
+            comment.content,
+            comment.created_time,
+        )
+        self._apply(lambda entries: self._insert(entries, item))
+
+    def deleted(self, comment):
+        self._apply(lambda entries: self._remove(entries, comment.id))
+
+    def _insert(self, entries: Deque[CommentItem], item: CommentItem) -> bool:
+        if not entries or item.id > entries[0].id:
+            # the common case, the oldest entry falls off the other end
+            entries.appendleft(item)
+            return True
+        ids = [entry.id for entry in entries]
+        if item.id in ids:
+            entries[ids.index(item.id)] = item
+            return True
+        if len(entries) < self.size or item.id > ids[-1]:
+            position = next((i for i, id_ in enumerate(ids) if id_ < item.id), len(ids))
+            if len(entries) == self.size:
+                entries.pop()
+            entries.insert(position, item)
+        return True
+
+    def _remove(self, entries: Deque[CommentItem], comment_id: int) -> bool:
+        # the buffer can only be topped up again from the database
+        return all(entry.id != comment_id for entry in entries)
+
+    def _apply(self, update):
+        """Bump the version and `update` the buffer in place, or drop it to reload."""
+        with self._lock:
+            previous = self._version
+            bump_version(COMMENTS_VERSION)
+            version = get_version(COMMENTS_VERSION)
+            # NOTE: a version that moved by more than our bump has missed changes of others
+            if (
+                self._entries is not None
+                and previous is not None
+                and version == previous + 1
+                and update(self._entries)
+            ):
+                self._version = version
+            else:
+                self._entries = None
+
+
+recent_comments = RecentComments(size=getattr(settings, "RECENT_COMMENT_COUNT", 10))
@@ -0,0 +1,28 @@
+from typing import Tuple
+
+import markdown
+
+# NOTE: bump when the extensions or their options change, `render_posts` re-renders stale posts
+RENDERER_VERSION = 1
+
+MARKDOWN_EXTENSIONS = [
+    "markdown.extensions.extra",
+    "markdown.extensions.sane_lists",
+    "markdown.extensions.toc",
+]
+
+
+def render_markdown(text: str) -> str:
+    return markdown.markdown(
+        text or "", extensions=MARKDOWN_EXTENSIONS, output_format="html5"
+    )
+
+
+def render_post(row: Tuple[int, str, str]) -> Tuple[int, str, str]:
+    """Render `(id, content, desc)` to `(id, content_html, desc_html)`.
+
+    Works on plain tuples without touching the database so it can run in a
+    process pool.
+    """
+    post_id, content, desc = row
+    return post_id, render_markdown(content), render_markdown(desc)
@@ -0,0 +1,118 @@
+import re
+from typing import Iterable, List
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = "blog_post_fts"
+
+# title, desc, content, the unindexed status column has no weight
+BM25_WEIGHTS = (10.0, 5.0, 1.0)
+
+_CJK = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff"
+_TOKEN_RE = re.compile(rf"[{_CJK}]+|[^\W_{_CJK}]+")
+_CJK_RE = re.compile(rf"[{_CJK}]")
+
+
+def tokenize(text: str, trailing: bool = False) -> List[str]:
+    """Split text into lowercase words, and CJK runs into overlapping bigrams.
+
+    FTS5's `unicode61` tokenizer keeps a whole CJK sentence as one token, so
+    the text is pre-tokenized here and stored space separated. With
+    `trailing`, the last character of a CJK run is also kept on its own: a
+    one-character query matches it, its bigrams only start with the others.
+    """
+    tokens = []
+    for run in _TOKEN_RE.findall(text or ""):
+        if _CJK_RE.match(run):
+            if len(run) == 1:
+                tokens.append(run)
+            else:
+                tokens.extend(run[i : i + 2] for i in range(len(run) - 1))
+                if trailing:
+                    tokens.append(run[-1])
+        else:
+            tokens.append(run.lower())
+    return tokens
+
+
+def index_text(text: str) -> str:
+    return " ".join(tokenize(text, trailing=True))
+
+
+def match_expression(query: str) -> str:
+    terms = []
+    for token in tokenize(query):
+        term = '"{}"'.format(token.replace('"', '""'))
+        # a lone CJK character is the start of a bigram or a trailing one, as a prefix
+        if len(token) == 1 and _CJK_RE.match(token):
+            term += "*"
+        terms.append(term)
+    return " ".join(terms)
+
+
+def is_available() -> bool:
+    return connection.vendor == "sqlite"
+
+
+def index_posts(posts: Iterable):
+    """Replace the index rows of `posts`."""
+    if not is_available():
+        return
+    posts = list(posts)
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [(post.id,) for post in posts]
+        )
+        cursor.executemany(
+            f"INSERT INTO {FTS_TABLE} (rowid, title, desc, content, status) "
+            "VALUES (%s, %s, %s, %s, %s)",
+            [
+                (
+                    post.id,
+                    index_text(post.title),
+                    index_text(post.desc),
+                    index_text(post.content),
+                    post.status,
+                )
+                for post in posts
+            ],
+        )
+
+
+def unindex_posts(post_ids: Iterable[int]):
+    if not is_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"DELETE FROM {FTS_TABLE} WHERE rowid = %s",
+            [(post_id,) for post_id in post_ids],
+        )
+
+
+def match_subquery(query: str) -> RawSQL:
+    """`rowid` subquery for `id__in` filters, so matches are never materialized."""
+    return RawSQL(
+        f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s",
+        [match_expression(query)],
+    )
+
+
+def search_post_ids(query: str, status: int = None, limit: int = None) -> List[int]:
+    """Ids of posts matching `query`, best bm25 rank first."""
+    expression = match_expression(query)
+    if not expression or not is_available():
+        return []
+    sql = f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s"
+    params = [expression]
+    if status is not None:
+        sql += " AND status = %s"
+        params.append(status)
+    sql += f" ORDER BY bm25({FTS_TABLE}, %s, %s, %s)"
+    params.extend(BM25_WEIGHTS)
+    if limit:
+        sql += " LIMIT %s"
+        params.append(limit)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
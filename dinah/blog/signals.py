@@ -0,0 +1,257 @@
+from django.core.signals import request_started
+from django.db import transaction
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.utils import timezone
+
+from blog import counts, pagecache, search, tagcloud
+from blog.cache import CONTENT_VERSION, SIDEBAR_VERSION, bump_version, touch_version
+from blog.models import Category, Comment, Post, SideBar, Tag
+from blog.recent import recent_comments
+
+
+def invalidate_sidebars(sender, **kwargs):
+    # NOTE: a rebuild before the commit would cache the old rows under the new version
+    transaction.on_commit(lambda: bump_version(SIDEBAR_VERSION))
+
+
+for model in (Post, Comment, SideBar):
+    for signal in (post_save, post_delete):
+        signal.connect(
+            invalidate_sidebars,
+            sender=model,
+            dispatch_uid=f"invalidate_sidebars_{model.__name__}_{signal is post_save}",
+        )
+
+
+def invalidate_navs(sender, **kwargs):
+    # NOTE: a rebuild before the commit would cache the navs of the old rows for good
+    transaction.on_commit(Category.invalidate_navs)
+
+
+post_save.connect(invalidate_navs, sender=Category, dispatch_uid="invalidate_navs_save")
+post_delete.connect(
+    invalidate_navs, sender=Category, dispatch_uid="invalidate_navs_delete"
+)
+
+
+def update_search_index(sender, instance, **kwargs):
+    search.index_posts([instance])
+
+
+def remove_search_index(sender, instance, **kwargs):
+    search.unindex_posts([instance.id])
+
+
+post_save.connect(update_search_index, sender=Post, dispatch_uid="update_search_index")
+post_delete.connect(
+    remove_search_index, sender=Post, dispatch_uid="remove_search_index"
+)
+
+
+def update_recent_comments(sender, instance, **kwargs):
+    transaction.on_commit(lambda: recent_comments.saved(instance))
+
+
+def remove_recent_comment(sender, instance, **kwargs):
+    transaction.on_commit(lambda: recent_comments.deleted(instance))
+
+
+post_save.connect(
+    update_recent_comments, sender=Comment, dispatch_uid="update_recent_comments"
+)
+post_delete.connect(
+    remove_recent_comment, sender=Comment, dispatch_uid="remove_recent_comment"
+)
+
+
+def prefill_recent_comments(sender, **kwargs):
+    # once per process, AppConfig.ready() runs before migrations and must not query
+    request_started.disconnect(dispatch_uid="prefill_recent_comments")
+    recent_comments.prefill()
+
+
+request_started.connect(prefill_recent_comments, dispatch_uid="prefill_recent_comments")
+
+
+def remember_post_state(sender, instance, **kwargs):
+    """Keep the stored (category_id, status) for the post_save handlers."""
+    instance._stored_state = None
+    if instance.pk is not None:
+        instance._stored_state = (
+            Post.objects.filter(pk=instance.pk)
+            .values_list("category_id", "status")
+            .first()
+        )
+
+
+pre_save.connect(remember_post_state, sender=Post, dispatch_uid="remember_post_state")
+
+
+def count_saved_post(sender, instance, **kwargs):
+    stored = getattr(instance, "_stored_state", None)
+    if stored == (instance.category_id, instance.status):
+        # most saves are edits, the counts stay
+        return
+    was_published = stored is not None and stored[1] == Post.STATUS_NORMAL
+    is_published = instance.status == Post.STATUS_NORMAL
+    if was_published:
+        counts.adjust_category(stored[0], -1)
+    if is_published:
+        counts.adjust_category(instance.category_id, 1)
+    if was_published != is_published:
+        tag_ids = instance.tag.values_list("id", flat=True)
+        counts.adjust_tags(tag_ids, 1 if is_published else -1)
+
+
+def count_deleted_post(sender, instance, **kwargs):
+    # NOTE: pre_delete, the tag rows are gone by post_delete
+    if instance.status == Post.STATUS_NORMAL:
+        counts.adjust_category(instance.category_id, -1)
+        counts.adjust_tags(instance.tag.values_list("id", flat=True), -1)
+
+
+def count_post_tags(sender, instance, action, reverse, pk_set, **kwargs):
+    # post_add only gets the new links, the removals are counted before they happen
+    if action not in ("post_add", "pre_remove", "pre_clear"):
+        return
+    links = Post.tag.through.objects.filter(post__status=Post.STATUS_NORMAL)
+    if reverse:
+        links = links.filter(tag_id=instance.id)
+        if action != "pre_clear":
+            links = links.filter(post_id__in=pk_set)
+        counts.adjust_tags(
+            [instance.id], links.count() * (1 if action == "post_add" else -1)
+        )
+        return
+    if instance.status != Post.STATUS_NORMAL:
+        return
+    if action == "post_add":
+        counts.adjust_tags(pk_set, 1)
+        return
+    links = links.filter(post_id=instance.id)
+    if action != "pre_clear":
+        links = links.filter(tag_id__in=pk_set)
+    counts.adjust_tags(links.values_list("tag_id", flat=True), -1)
+
+
+post_save.connect(count_saved_post, sender=Post, dispatch_uid="count_saved_post")
+pre_delete.connect(count_deleted_post, sender=Post, dispatch_uid="count_deleted_post")
+m2m_changed.connect(
+    count_post_tags, sender=Post.tag.through, dispatch_uid="count_post_tags"
+)
+
+
+def purge_moved_post_pages(sender, instance, **kwargs):
+    stored = getattr(instance, "_stored_state", None)
+    if stored is not None and stored[0] != instance.category_id:
+        pagecache.purge(pagecache.category_posts_dep(stored[0]))
+
+
+def purge_post_pages(sender, instance, **kwargs):
+    tag_ids = instance.tag.values_list("id", flat=True)
+    pagecache.purge(
+        pagecache.post_dep(instance.id),
+        pagecache.SIDEBARS,
+        *pagecache.post_listing_deps(instance.category_id, tag_ids),
+    )
+
+
+def purge_post_tag_pages(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+    if action == "pre_clear":
+        related = instance.post_set if reverse else instance.tag
+        pk_set = related.values_list("id", flat=True)
+    if reverse:
+        deps = [pagecache.tag_posts_dep(instance.id), *map(pagecache.post_dep, pk_set)]
+    else:
+        deps = [pagecache.post_dep(instance.id), *map(pagecache.tag_posts_dep, pk_set)]
+    pagecache.purge(*deps)
+
+
+def touch_tagged_posts(sender, instance, action, reverse, pk_set, **kwargs):
+    # tags are shown on the post, so a tag change is a change of the post
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+    if not reverse:
+        post_ids = [instance.id]
+    elif action == "pre_clear":
+        post_ids = list(instance.post_set.values_list("id", flat=True))
+    else:
+        post_ids = list(pk_set)
+    Post.objects.filter(id__in=post_ids).update(updated_time=timezone.now())
+
+
+def purge_category_pages(sender, instance, **kwargs):
+    pagecache.purge(pagecache.category_dep(instance.id), pagecache.NAVS)
+
+
+def purge_tag_pages(sender, instance, **kwargs):
+    pagecache.purge(pagecache.tag_dep(instance.id))
+
+
+def purge_comment_pages(sender, instance, **kwargs):
+    pagecache.purge(pagecache.post_dep(instance.target_id), pagecache.SIDEBARS)
+
+
+def purge_sidebar_pages(sender, instance, **kwargs):
+    pagecache.purge(pagecache.SIDEBARS)
+
+
+post_save.connect(purge_moved_post_pages, sender=Post, dispatch_uid="purge_moved_post")
+post_save.connect(purge_post_pages, sender=Post, dispatch_uid="purge_post_save")
+pre_delete.connect(purge_post_pages, sender=Post, dispatch_uid="purge_post_delete")
+m2m_changed.connect(
+    purge_post_tag_pages, sender=Post.tag.through, dispatch_uid="purge_post_tag"
+)
+m2m_changed.connect(
+    touch_tagged_posts, sender=Post.tag.through, dispatch_uid="touch_tagged_posts"
+)
+for model, handler in (
+    (Category, purge_category_pages),
+    (Tag, purge_tag_pages),
+    (Comment, purge_comment_pages),
+    (SideBar, purge_sidebar_pages),
+):
+    for signal in (post_save, post_delete):
+        signal.connect(
+            handler,
+            sender=model,
+            dispatch_uid=f"purge_{model.__name__}_{signal is post_save}",
+        )
+
+
+def refresh_tag_cloud(sender, instance, **kwargs):
+    # a renamed or hidden tag shows at once, post counts wait for `refresh_tag_cloud`
+    transaction.on_commit(tagcloud.refresh_tag_cloud)
+
+
+for signal in (post_save, post_delete):
+    signal.connect(
+        refresh_tag_cloud,
+        sender=Tag,
+        dispatch_uid=f"refresh_tag_cloud_{signal is post_save}",
+    )
+
+
+def touch_content(sender, instance=None, **kwargs):
+    modified = getattr(instance, "updated_time", None)
+    transaction.on_commit(lambda: touch_version(CONTENT_VERSION, modified))
+
+
+for model in (Post, Category, Tag, SideBar, Comment):
+    for signal in (post_save, post_delete):
+        signal.connect(
+            touch_content,
+            sender=model,
+            dispatch_uid=f"touch_content_{model.__name__}_{signal is post_save}",
+        )
+m2m_changed.connect(
+    touch_content, sender=Post.tag.through, dispatch_uid="touch_content_post_tag"
+)
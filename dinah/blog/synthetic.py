@@ -0,0 +1,228 @@
+"""Seed the database with a synthetic blog of a given size, for benchmarks.
+
+The same `seed` and size always produce the same rows. The shape follows a
+real blog more than uniform noise: a few categories and tags hold most
+posts (Zipf), posts carry one to five tags, comments and page views are
+heavy-tailed and a third of the comments are replies.
+"""
+import bisect
+import datetime
+import itertools
+import math
+import random
+from typing import Dict, List, Sequence
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from blog import search
+from blog.counts import recount_posts
+from blog.hotness import view_score
+from blog.models import Category, Comment, HotPost, Post, Tag
+from blog.rendering import RENDERER_VERSION
+from blog.tagcloud import refresh_tag_cloud
+
+WORDS = (
+    "django python mako cache query index page view tag category comment "
+    "sidebar markdown render database sqlite server request response "
+    "template thread process memory latency benchmark deploy migration"
+).split()
+
+# share of the posts that are drafts and deleted
+DRAFT_RATIO = 0.03
+DELETED_RATIO = 0.02
+REPLY_RATIO = 0.3
+NAV_CATEGORIES = 4
+MAX_COMMENTS = 500
+
+
+class ZipfChoice:
+    """Pick indexes in `range(n)` with weights 1 / (rank + 1) ** s."""
+
+    def __init__(self, n: int, s: float = 1.1):
+        self.cumulative = list(
+            itertools.accumulate(1 / (rank + 1) ** s for rank in range(n))
+        )
+
+    def __call__(self, rng: random.Random) -> int:
+        return bisect.bisect_left(self.cumulative, rng.random() * self.cumulative[-1])
+
+
+def dataset_shape(posts: int) -> Dict[str, int]:
+    """Numbers of authors, categories and tags growing sublinearly with posts."""
+    return {
+        "authors": max(1, round(math.log10(max(posts, 10)))),
+        "categories": max(5, round(posts ** (1 / 3))),
+        "tags": max(20, round(2 * math.sqrt(posts))),
+    }
+
+
+def _sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choices(WORDS, k=words))
+
+
+def _content(rng: random.Random) -> Sequence[str]:
+    """Markdown of a post and the HTML it renders to."""
+    paragraphs = [_sentence(rng, rng.randint(20, 80)) for _ in range(rng.randint(2, 8))]
+    markdown = "\n\n".join(paragraphs)
+    # NOTE: written directly, running Markdown on a million posts takes hours
+    html = "\n".join(f"<p>{paragraph}</p>" for paragraph in paragraphs)
+    return markdown, html
+
+
+class SyntheticBlog:
+    def __init__(self, posts: int, seed: int = 0, batch_size: int = 1000):
+        self.total = posts
+        self.rng = random.Random(seed)
+        self.batch_size = batch_size
+        self.shape = dataset_shape(posts)
+        self.now = timezone.now()
+        # five years of posts
+        self.first_time = self.now - datetime.timedelta(days=5 * 365)
+
+    def generate(self) -> Dict[str, int]:
+        """Insert the whole blog, returns the number of rows by kind."""
+        self.owners = self._create_named(
+            User,
+            [f"author{i}" for i in range(self.shape["authors"])],
+            lambda name: User(username=name, is_staff=True),
+        )
+        self.categories = self._create_named(
+            Category,
+            [f"分类{i}" for i in range(self.shape["categories"])],
+            lambda name: Category(name=name, owner_id=self.owners[0], is_nav=False),
+        )
+        # the most used categories make the navigation
+        Category.objects.filter(id__in=self.categories[:NAV_CATEGORIES]).update(
+            is_nav=True
+        )
+        self.tags = self._create_named(
+            Tag,
+            [f"标签{i}" for i in range(self.shape["tags"])],
+            lambda name: Tag(name=name, owner_id=self.owners[0]),
+        )
+        self.pick_category = ZipfChoice(len(self.categories))
+        self.pick_tag = ZipfChoice(len(self.tags))
+
+        counts = {"posts": 0, "comments": 0}
+        for start in range(0, self.total, self.batch_size):
+            size = min(self.batch_size, self.total - start)
+            posts, comments = self._insert_batch(start, size)
+            counts["posts"] += posts
+            counts["comments"] += comments
+
+        recount_posts()
+        refresh_tag_cloud()
+        counts.update(
+            authors=len(self.owners),
+            categories=len(self.categories),
+            tags=len(self.tags),
+        )
+        return counts
+
+    def _create_named(self, model, names: List[str], build) -> List[int]:
+        model.objects.bulk_create([build(name) for name in names])
+        field = "username" if model is User else "name"
+        ids = dict(
+            model.objects.filter(**{f"{field}__in": names}).values_list(field, "id")
+        )
+        return [ids[name] for name in names]
+
+    @staticmethod
+    def _next_ids(model, count: int) -> List[int]:
+        # NOTE: allocated here, SQLite can't return the ids of a bulk insert
+        first = (model.objects.aggregate(last=Max("id"))["last"] or 0) + 1
+        return list(range(first, first + count))
+
+    def _status(self) -> int:
+        value = self.rng.random()
+        if value < DRAFT_RATIO:
+            return Post.STATUS_DRAFT
+        if value < DRAFT_RATIO + DELETED_RATIO:
+            return Post.STATUS_DELETE
+        return Post.STATUS_NORMAL
+
+    def _insert_batch(self, start: int, size: int):
+        rng = self.rng
+        span = (self.now - self.first_time) / self.total
+        posts, times, tag_rows, hot = [], [], [], []
+        for post_id, i in zip(self._next_ids(Post, size), range(start, start + size)):
+            content, content_html = _content(rng)
+            desc = _sentence(rng, rng.randint(8, 30))
+            pv = int(rng.lognormvariate(4, 1.5)) + 1
+            post = Post(
+                id=post_id,
+                title=_sentence(rng, rng.randint(3, 10)),
+                desc=desc,
+                desc_html=f"<p>{desc}</p>",
+                content=content,
+                content_html=content_html,
+                render_version=RENDERER_VERSION,
+                status=self._status(),
+                category_id=self.categories[self.pick_category(rng)],
+                owner_id=rng.choice(self.owners),
+                pv=pv,
+                uv=max(1, int(pv * rng.uniform(0.3, 0.9))),
+            )
+            posts.append(post)
+            # in id order, like posts written one after the other
+            times.append(self.first_time + span * (i + rng.random()))
+            tag_ids = {
+                self.tags[self.pick_tag(rng)]
+                for _ in range(min(5, 1 + int(rng.expovariate(0.8))))
+            }
+            tag_rows.extend(
+                Post.tag.through(post_id=post_id, tag_id=tag_id) for tag_id in tag_ids
+            )
+            if post.status == Post.STATUS_NORMAL:
+                hot.append(HotPost(post_id=post_id, score=view_score(pv, times[-1])))
+
+        with transaction.atomic():
+            Post.objects.bulk_create(posts)
+            # bulk_create stamps auto_now(_add) fields, put the synthetic dates back
+            for post, created_time in zip(posts, times):
+                post.created_time = post.updated_time = created_time
+            Post.objects.bulk_update(posts, ["created_time", "updated_time"])
+            Post.tag.through.objects.bulk_create(tag_rows)
+            HotPost.objects.bulk_create(hot)
+            comments = self._insert_comments(posts)
+            search.index_posts(posts)
+        return len(posts), comments
+
+    def _insert_comments(self, posts: List[Post]) -> int:
+        rng = self.rng
+        planned = [
+            (post, min(MAX_COMMENTS, int(rng.paretovariate(1.5)) - 1))
+            for post in posts
+            if post.status == Post.STATUS_NORMAL
+        ]
+        ids = iter(self._next_ids(Comment, sum(count for _, count in planned)))
+        comments = []
+        for post, count in planned:
+            thread: List[Comment] = []
+            for _ in range(count):
+                comment = Comment(
+                    id=next(ids),
+                    target_id=post.id,
+                    author=f"读者{rng.randint(1, 10000)}",
+                    email="reader@example.com",
+                    home_site="https://example.com",
+                    content=_sentence(rng, rng.randint(3, 40)),
+                )
+                parent = (
+                    rng.choice(thread)
+                    if thread and rng.random() < REPLY_RATIO
+                    else None
+                )
+                if parent is not None and parent.depth < Comment.MAX_DEPTH:
+                    comment.parent_id = parent.id
+                    comment.root_id = parent.root_id
+                    comment.path = f"{parent.path}{comment.id:0{Comment.PATH_SEGMENT}d}"
+                else:
+                    comment.root_id, comment.path = comment.id, ""
+                thread.append(comment)
+                comments.append(comment)
+        Comment.objects.bulk_create(comments)
+        return len(comments)
@@ -0,0 +1,94 @@
+import math
+from typing import List, NamedTuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+from blog import pagecache
+from blog.cache import (
+    CONTENT_VERSION,
+    TAG_CLOUD_VERSION,
+    bump_version,
+    get_version,
+    touch_version,
+)
+from blog.models import Tag
+from utils.metrics import count_cache
+from utils.shortcuts import render_mako_to_string
+
+TAG_CLOUD_KEY = "tagcloud:items"
+
+
+class TagCloudItem(NamedTuple):
+    id: int
+    name: str
+    post_count: int
+    weight: int
+
+
+def size_class(count: int, low: int, high: int, classes: int) -> int:
+    """Size class in [1, classes] of a post count, on a log scale from low to high."""
+    if high <= low:
+        return 1
+    ratio = (math.log(count) - math.log(low)) / (math.log(high) - math.log(low))
+    return 1 + min(classes - 1, int(ratio * classes))
+
+
+def refresh_tag_cloud() -> bool:
+    """Recompute the tag weights from `Tag.post_count`, returns whether the cloud changed.
+
+    Only this refresh reads the counts, requests read the cached result.
+    """
+    rows = list(
+        Tag.objects.filter(status=Tag.STATUS_NORMAL)
+        .order_by("name", "id")
+        .values_list("id", "name", "post_count", "weight")
+    )
+    counts = [count for _, _, count, _ in rows if count]
+    low, high = (min(counts), max(counts)) if counts else (0, 0)
+
+    items, changed = [], []
+    for tag_id, name, count, weight in rows:
+        new_weight = (
+            size_class(count, low, high, settings.TAG_CLOUD_CLASSES) if count else 0
+        )
+        if new_weight != weight:
+            changed.append(Tag(id=tag_id, weight=new_weight))
+        if count:
+            items.append(TagCloudItem(tag_id, name, count, new_weight))
+    Tag.objects.bulk_update(changed, ["weight"])
+
+    if items == cache.get(TAG_CLOUD_KEY):
+        return False
+    cache.set(TAG_CLOUD_KEY, items, None)
+    bump_version(TAG_CLOUD_VERSION)
+    pagecache.purge(pagecache.TAGS)
+    # pages showing the cloud answer conditional requests from this version
+    touch_version(CONTENT_VERSION)
+    return True
+
+
+def tag_cloud_items() -> List[TagCloudItem]:
+    items = cache.get(TAG_CLOUD_KEY)
+    if items is None:
+        # weights as of the last refresh, read straight from the tag rows
+        rows = (
+            Tag.objects.filter(status=Tag.STATUS_NORMAL, post_count__gt=0)
+            .order_by("name", "id")
+            .values_list("id", "name", "post_count", "weight")
+        )
+        items = [TagCloudItem(*row) for row in rows]
+        cache.set(TAG_CLOUD_KEY, items, None)
+    return items
+
+
+def tag_cloud_html() -> str:
+    key = f"tagcloud:html:{get_version(TAG_CLOUD_VERSION)}"
+    html = cache.get(key)
+    count_cache("tag_cloud", hit=html is not None)
+    if html is None:
+        html = render_mako_to_string(
+            "blocks/tag_cloud.mako", context={"tags": tag_cloud_items()}
+        )
+        cache.set(key, html, settings.SIDEBAR_CACHE_TIMEOUT)
+    return html
@@ -1,3 +1,1173 @@
-from django.test import TestCase
+import datetime
+import gzip
+import io
+import json
+import os
+import sqlite3
+import tarfile
+import tempfile
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.http import Http404
+from django.template import engines
+from django.test import (
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from mako.lookup import TemplateLookup
+
+from blog import pagecache, search, signals
+from blog.backup import write_backup
+from blog.benchmarks import build_benchmarks, compare, run_benchmark
+from blog.cache import COMMENTS_VERSION, bump_version
+from blog.counters import PageViewBuffer, pv_buffer
+from blog.export import (
+    Page,
+    export_pages,
+    rewrite_links,
+    site_pages,
+    site_state,
+    stale_pages,
+)
+from blog.hll import HyperLogLog
+from blog.hotness import bucket_start, refresh_hotness
+from blog.models import (
+    DISPLAY_COMMENT,
+    DISPLAY_LATEST,
+    DISPLAY_TAGS,
+    Category,
+    Comment,
+    HotPost,
+    Link,
+    Post,
+    PostSummary,
+    PostViewBucket,
+    SideBar,
+    Tag,
+    VisitorSketch,
+)
+from blog.recent import RecentComments
+from blog.synthetic import SyntheticBlog
+from blog.tagcloud import refresh_tag_cloud, size_class, tag_cloud_items
+from blog.rendering import RENDERER_VERSION
+from blog.views import post_details_view
+from utils.instrumentation import (
+    TIME_BUCKETS,
+    Histogram,
+    exponential_buckets,
+    request_metrics,
+)
+from utils.metrics import merge_samples, process_metrics
+from utils.pagination import encode_cursor, paginate_by_id
+
+
+class BlogTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="dinah", password="dinah")
+        cls.category = Category.objects.create(name="默认", owner=cls.user)
+
+    @classmethod
+    def create_post(cls, **kwargs) -> Post:
+        kwargs.setdefault("title", "标题")
+        kwargs.setdefault("desc", "简要")
+        kwargs.setdefault("content", "正文")
+        kwargs.setdefault("category", cls.category)
+        kwargs.setdefault("owner", cls.user)
+        return Post.objects.create(**kwargs)
+
+
+class BlogTransactionTestCase(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="dinah", password="dinah")
+        self.category = Category.objects.create(name="默认", owner=self.user)
+
+    def tearDown(self):
+        pv_buffer.flush()
+
+    def create_post(self, **kwargs) -> Post:
+        return BlogTestCase.create_post.__func__(self, **kwargs)
+
+
+class PageViewBufferTests(BlogTestCase):
+    def setUp(self):
+        self.buffer = PageViewBuffer(flush_interval=0)
+
+    def test_flush_writes_deltas_in_batch(self):
+        first, second = self.create_post(), self.create_post()
+        for _ in range(3):
+            self.buffer.incr(first.id)
+        self.buffer.incr(second.id)
+
+        self.assertEqual(self.buffer.pending(first.id), 3)
+        self.assertEqual(self.buffer.flush(), 2)
+        self.assertEqual(self.buffer.pending(first.id), 0)
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.pv, 4)
+        self.assertEqual(second.pv, 2)
+
+    def test_flush_merges_visitor_sketches(self):
+        post = self.create_post()
+        other_worker = PageViewBuffer(flush_interval=0)
+        for i in range(300):
+            self.buffer.incr(post.id, visitor=f"visitor-{i}")
+            other_worker.incr(post.id, visitor=f"visitor-{i + 200}")
+        self.buffer.flush()
+        other_worker.flush()
+
+        post.refresh_from_db()
+        self.assertAlmostEqual(post.uv, 500, delta=25)
+        self.assertEqual(post.get_uv(), post.uv)
+        self.assertEqual(post.get_uv(timezone.localdate()), post.uv)
+        self.assertEqual(VisitorSketch.objects.filter(post=post).count(), 2)
+
+
+class HotPostsTests(BlogTestCase):
+    def test_recent_views_outrank_old_ones(self):
+        old, recent = self.create_post(), self.create_post()
+        now = timezone.now()
+        PostViewBucket.objects.create(
+            post=old, period=bucket_start(now - datetime.timedelta(days=3)), views=50
+        )
+        PostViewBucket.objects.create(post=recent, period=bucket_start(now), views=10)
+
+        self.assertEqual(refresh_hotness(), 2)
+        self.assertEqual(list(Post.hot_posts()), [recent, old])
+
+    def test_refresh_is_incremental(self):
+        post = self.create_post()
+        buffer = PageViewBuffer(flush_interval=0)
+        buffer.incr(post.id, pv=4)
+        buffer.flush()
+        refresh_hotness()
+        score = HotPost.objects.get(post=post).score
+
+        self.assertEqual(refresh_hotness(), 0)
+        buffer.incr(post.id, pv=4)
+        buffer.flush()
+        refresh_hotness()
+        # the same bucket doubled its views
+        self.assertAlmostEqual(HotPost.objects.get(post=post).score, score + 1)
+
+
+@skipUnless(connection.vendor == "sqlite", "query plans are SQLite specific")
+class QueryPlanTests(BlogTestCase):
+    def assertUsesIndex(self, qs, index):
+        sql, params = qs.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+            plan = " ".join(row[-1] for row in cursor.fetchall())
+        self.assertIn(index, plan)
+
+    def test_listings_use_indexes(self):
+        tag = Tag.objects.create(name="标签", owner=self.user)
+        self.assertUsesIndex(Post.latest_post()[:10], "blog_post_normal_id_idx")
+        self.assertUsesIndex(
+            Post.get_by_category(self.category.id)[0][:10], "blog_post_category_id_idx"
+        )
+        self.assertUsesIndex(
+            Post.tag.through.objects.filter(tag=tag).values("post_id"),
+            "COVERING INDEX blog_post_tag_tag_post_idx",
+        )
+        self.assertUsesIndex(
+            Post.objects.filter(owner=self.user).order_by("-id")[:10],
+            "blog_post_owner_id_idx",
+        )
+        comments = Comment.objects.filter(target_id=1).order_by("root_id", "path")
+        self.assertUsesIndex(comments[:10], "blog_comment_thread_idx")
+
+
+class HyperLogLogTests(SimpleTestCase):
+    def test_estimate_and_roundtrip(self):
+        sketch = HyperLogLog()
+        sketch.update(str(i) for i in range(20000))
+        self.assertAlmostEqual(sketch.count(), 20000, delta=20000 * 0.05)
+
+        restored = HyperLogLog.from_bytes(sketch.to_bytes())
+        self.assertEqual(restored.registers, sketch.registers)
+
+    def test_sparse_encoding_is_compact(self):
+        sketch = HyperLogLog()
+        sketch.update(["a", "b", "c"])
+        self.assertLess(len(sketch.to_bytes()), 16)
+        self.assertEqual(HyperLogLog.from_bytes(sketch.to_bytes()).count(), 3)
+
+
+class KeysetPaginationTests(BlogTestCase):
+    def test_pages_follow_cursor(self):
+        ids = [self.create_post().id for _ in range(5)]
+        first = paginate_by_id(Post.latest_post(), per_page=2)
+        self.assertEqual([p.id for p in first.items], ids[::-1][:2])
+        self.assertTrue(first.has_next)
+
+        second = paginate_by_id(Post.latest_post(), after=first.next_after, per_page=2)
+        self.assertEqual([p.id for p in second.items], ids[::-1][2:4])
+
+        last = paginate_by_id(Post.latest_post(), after=second.next_after, per_page=2)
+        self.assertEqual([p.id for p in last.items], ids[:1])
+        self.assertFalse(last.has_next)
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(Http404):
+            paginate_by_id(Post.latest_post(), after="not-a-cursor")
+
+
+class CommentThreadTests(BlogTestCase):
+    def comment(self, parent=None, **kwargs) -> Comment:
+        kwargs.setdefault("target", self.post)
+        return Comment.objects.create(
+            parent=parent,
+            author="路人",
+            content="评论",
+            home_site="https://example.com",
+            email="a@example.com",
+            **kwargs,
+        )
+
+    def setUp(self):
+        self.post = self.create_post()
+
+    def test_threads_in_display_order(self):
+        first = self.comment()
+        second = self.comment()
+        reply = self.comment(parent=first)
+        nested = self.comment(parent=reply)
+        late_reply = self.comment(parent=first)
+
+        page = Comment.get_page(self.post.id, per_page=10)
+        self.assertEqual(page.items, [first, reply, nested, late_reply, second])
+        self.assertEqual([c.depth for c in page.items], [0, 1, 2, 1, 0])
+        self.assertEqual(list(reply.subtree()), [reply, nested])
+        self.assertEqual(list(first.subtree()), [first, reply, nested, late_reply])
+
+    def test_pages_split_threads(self):
+        root = self.comment()
+        replies = [self.comment(parent=root) for _ in range(3)]
+        other = self.comment()
+
+        seen, after = [], None
+        while True:
+            page = Comment.get_page(self.post.id, after=after, per_page=2)
+            seen.extend(page.items)
+            if not page.has_next:
+                break
+            after = page.next_after
+        self.assertEqual(seen, [root, *replies, other])
+
+        response = self.client.get(f"/post/{self.post.id}/comments?after={after}")
+        self.assertContains(response, f'id="comment-{other.id}"')
+        self.assertNotContains(response, f'id="comment-{root.id}"')
+
+    def test_deep_replies_are_capped(self):
+        parent = self.comment()
+        for _ in range(Comment.MAX_DEPTH + 2):
+            parent = self.comment(parent=parent)
+        self.assertEqual(parent.depth, Comment.MAX_DEPTH)
+
+    def test_admin_cannot_move_comments(self):
+        root = self.comment()
+        reply = self.comment(parent=root)
+        other = self.comment()
+        self.client.force_login(
+            User.objects.create_superuser("admin", "admin@example.com", "admin")
+        )
+        self.client.post(
+            f"/admin/blog/comment/{reply.id}/change/",
+            {
+                "target": self.post.id,
+                "parent": other.id,
+                "author": "路人",
+                "content": "改过的评论",
+                "home_site": "https://example.com",
+                "email": "a@example.com",
+                "status": Comment.STATUS_NORMAL,
+            },
+        )
+        reply.refresh_from_db()
+        self.assertEqual(reply.content, "改过的评论")
+        self.assertEqual((reply.parent_id, reply.root_id), (root.id, root.id))
+        self.assertEqual(list(root.subtree()), [root, reply])
+
+
+class PostSummaryTests(BlogTestCase):
+    def test_summaries_skip_content_and_batch_tags(self):
+        tags = [Tag.objects.create(name=f"标签{i}", owner=self.user) for i in range(2)]
+        for _ in range(3):
+            self.create_post(content="正文" * 1000).tag.set(tags)
+        self.create_post(status=Post.STATUS_DRAFT)
+
+        with CaptureQueriesContext(connection) as queries:
+            page = paginate_by_id(Post.summarize(Post.latest_post()), per_page=2)
+            summaries = PostSummary.from_rows(page.items)
+        self.assertEqual(len(queries), 2)
+        self.assertNotIn('"content"', queries[0]["sql"])
+
+        summary = summaries[0]
+        self.assertEqual(summary.category_name, self.category.name)
+        self.assertEqual(summary.owner_name, self.user.username)
+        self.assertEqual([tag.name for tag in summary.tags], ["标签0", "标签1"])
+        self.assertFalse(hasattr(summary, "__dict__"))
+        self.assertTrue(page.has_next)
+
+
+class PostCountTests(BlogTestCase):
+    def assertCounts(self, category, tags):
+        self.category.refresh_from_db()
+        self.other.refresh_from_db()
+        self.assertEqual((self.category.post_count, self.other.post_count), category)
+        self.assertEqual(
+            tuple(Tag.objects.order_by("id").values_list("post_count", flat=True)), tags
+        )
+
+    def test_counts_follow_changes(self):
+        self.other = Category.objects.create(name="其他", owner=self.user)
+        first, second = [
+            Tag.objects.create(name=f"标签{i}", owner=self.user) for i in range(2)
+        ]
+        post = self.create_post()
+        post.tag.set([first, second])
+        draft = self.create_post(status=Post.STATUS_DRAFT)
+        draft.tag.add(first)
+        self.assertCounts((1, 0), (1, 1))
+
+        draft.status = Post.STATUS_NORMAL
+        draft.save()
+        self.assertCounts((2, 0), (2, 1))
+
+        post.category = self.other
+        post.save()
+        post.tag.remove(second, first)
+        self.assertCounts((1, 1), (1, 0))
+
+        second.post_set.add(post, draft)
+        first.post_set.clear()
+        self.assertCounts((1, 1), (0, 2))
+
+        draft.delete()
+        post.status = Post.STATUS_DELETE
+        post.save()
+        self.assertCounts((0, 0), (0, 0))
+
+    def test_edit_leaves_counts_alone(self):
+        post = self.create_post()
+        post.title = "新标题"
+        with mock.patch("blog.counts.adjust_category") as adjust:
+            post.save()
+        adjust.assert_not_called()
+
+    def test_repair_recounts(self):
+        self.other = Category.objects.create(name="其他", owner=self.user)
+        tag = Tag.objects.create(name="标签", owner=self.user)
+        self.create_post().tag.add(tag)
+        self.create_post(category=self.other)
+        Category.objects.update(post_count=7)
+        Tag.objects.update(post_count=7)
+
+        # one UPDATE per table, inside a savepoint
+        with self.assertNumQueries(4):
+            call_command("repair_post_counts", stdout=io.StringIO())
+        self.assertCounts((1, 1), (1,))
+
+
+class TagCloudTests(BlogTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_size_class_is_logarithmic(self):
+        self.assertEqual(
+            [size_class(count, 1, 100, 5) for count in (1, 3, 10, 30, 100)],
+            [1, 2, 3, 4, 5],
+        )
+        self.assertEqual(size_class(4, 4, 4, 5), 1)
+
+    def test_refresh_weights_and_cached_sidebar(self):
+        tags = [Tag.objects.create(name=f"标签{i}", owner=self.user) for i in range(3)]
+        for i in range(8):
+            self.create_post().tag.add(*tags[: 1 if i else 2])
+        sidebar = SideBar.objects.create(
+            title="标签云", display_type=DISPLAY_TAGS, owner=self.user
+        )
+
+        self.assertTrue(refresh_tag_cloud())
+        self.assertFalse(refresh_tag_cloud())
+        self.assertEqual(
+            list(Tag.objects.order_by("id").values_list("weight", flat=True)), [5, 1, 0]
+        )
+        self.assertEqual(
+            [(item.name, item.weight) for item in tag_cloud_items()],
+            [("标签0", 5), ("标签1", 1)],
+        )
+        self.assertIn('class="tag-size-5"'.encode(), sidebar.content_html)
+        with self.assertNumQueries(0):
+            sidebar.content_html
+
+        response = self.client.get("/tags")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("标签1".encode(), response.content)
+
+
+class SideBarCacheTests(BlogTransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.sidebar = SideBar.objects.create(
+            title="最新文章", display_type=DISPLAY_LATEST, owner=self.user
+        )
+
+    def test_warm_cache_costs_no_query(self):
+        self.create_post(title="第一篇")
+        self.assertIn("第一篇".encode(), self.sidebar.content_html)
+        with self.assertNumQueries(0):
+            self.sidebar.content_html
+
+    def test_post_save_invalidates(self):
+        post = self.create_post(title="第一篇")
+        self.sidebar.content_html
+        post.title = "改过的标题"
+        post.save()
+        self.assertIn("改过的标题".encode(), self.sidebar.content_html)
+
+    def test_invalidated_once_committed(self):
+        self.sidebar.content_html
+        with transaction.atomic():
+            self.create_post(title="第一篇")
+            with self.assertNumQueries(0):
+                self.sidebar.content_html
+        self.assertIn("第一篇".encode(), self.sidebar.content_html)
+
+    def test_titles_are_escaped(self):
+        self.create_post(title="<b>粗体</b>")
+        html = self.sidebar.content_html
+        self.assertIn("&lt;b&gt;粗体&lt;/b&gt;".encode(), html)
+        self.assertNotIn(b"<b>", html)
+
+
+class NavsCacheTests(BlogTransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        Category.invalidate_navs()
+
+    def test_snapshot_is_reused_until_category_changes(self):
+        navs = Category.get_navs()
+        self.assertEqual(navs.categories, ((self.category.id, "默认"),))
+        with self.assertNumQueries(0):
+            self.assertIs(Category.get_navs(), navs)
+
+        Category.objects.create(name="导航", is_nav=True, owner=self.user)
+        navs = Category.get_navs()
+        self.assertEqual([c.name for c in navs.navs], ["导航"])
+
+    def test_invalidated_once_committed(self):
+        navs = Category.get_navs()
+        with transaction.atomic():
+            Category.objects.create(name="导航", is_nav=True, owner=self.user)
+            self.assertIs(Category.get_navs(), navs)
+        self.assertEqual([c.name for c in Category.get_navs().navs], ["导航"])
+
+
+class MarkdownRenderingTests(BlogTestCase):
+    def test_save_renders_content_and_desc(self):
+        post = self.create_post(content="# 标题\n\n*正文*", desc="**简要**")
+        self.assertIn("<em>正文</em>", post.content_html)
+        self.assertEqual(post.desc_html, "<p><strong>简要</strong></p>")
+        self.assertEqual(post.render_version, RENDERER_VERSION)
+
+    def test_render_posts_command_updates_stale_posts(self):
+        post = self.create_post(content="*正文*")
+        Post.objects.filter(id=post.id).update(content_html="", render_version=0)
+
+        call_command("render_posts", workers=1, stdout=io.StringIO())
+
+        post.refresh_from_db()
+        self.assertEqual(post.content_html, "<p><em>正文</em></p>")
+        self.assertEqual(post.render_version, RENDERER_VERSION)
+
+
+class SearchTests(BlogTestCase):
+    def test_tokenize_cjk_bigrams(self):
+        self.assertEqual(search.tokenize("Django全文搜索"), ["django", "全文", "文搜", "搜索"])
+
+    def test_search_ranks_title_matches_first(self):
+        in_content = self.create_post(title="其他", content="介绍全文搜索的实现")
+        in_title = self.create_post(title="全文搜索", content="正文")
+        self.create_post(title="全文搜索草稿", status=Post.STATUS_DRAFT)
+
+        ids = search.search_post_ids("全文搜索", status=Post.STATUS_NORMAL)
+        self.assertEqual(ids, [in_title.id, in_content.id])
+
+    def test_single_character_matches_anywhere_in_a_run(self):
+        post = self.create_post(title="其他", content="你好世界")
+        for query in ("你", "世", "界"):
+            self.assertEqual(search.search_post_ids(query), [post.id], query)
+        # the trailing character is for one-character queries only
+        self.assertEqual(search.search_post_ids("世界"), [post.id])
+
+    def test_index_follows_delete(self):
+        post = self.create_post(title="全文搜索")
+        post.delete()
+        self.assertEqual(search.search_post_ids("搜索"), [])
+
+    def test_admin_search_uses_index(self):
+        post = self.create_post(title="全文搜索", status=Post.STATUS_DRAFT)
+        self.create_post(title="其他")
+        self.client.force_login(
+            User.objects.create_superuser("admin", "admin@example.com", "admin")
+        )
+        Post.objects.update(owner=User.objects.get(username="admin"))
+        response = self.client.get("/admin/blog/post/", {"q": "搜索"})
+        self.assertEqual([p.id for p in response.context["cl"].result_list], [post.id])
+
+
+class CompileTemplatesTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.templates = os.path.join(tmp.name, "templates")
+        self.modules = os.path.join(tmp.name, "modules")
+        os.makedirs(os.path.join(self.templates, "blocks"))
+        lookup = TemplateLookup(
+            directories=[self.templates], module_directory=self.modules
+        )
+        patcher = mock.patch.object(engines["mako"].engine, "lookup", lookup)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def write(self, uri: str, source: str):
+        with open(os.path.join(self.templates, uri), "w") as f:
+            f.write(source)
+
+    def test_compiles_every_template(self):
+        self.write("page.mako", "<%include file='/blocks/title.mako'/>")
+        self.write("blocks/title.mako", "<h1>${title | h}</h1>")
+        call_command("compile_templates", stdout=io.StringIO())
+        for uri in ("page.mako", "blocks/title.mako"):
+            self.assertTrue(os.path.exists(os.path.join(self.modules, uri + ".py")))
+
+    def test_syntax_error_fails(self):
+        self.write("page.mako", "<p>ok</p>")
+        self.write("blocks/broken.mako", "% for post in posts:\n${post}\n")
+        with self.assertRaisesMessage(CommandError, "blocks/broken.mako"):
+            call_command("compile_templates", stdout=io.StringIO())
+
+
+class PageCacheTests(BlogTransactionTestCase):
+    def test_post_page_purged_only_by_its_dependencies(self):
+        post, other = self.create_post(), self.create_post()
+        url = f"/post/{post.id}"
+        self.assertEqual(self.client.get(url)["X-Page-Cache"], "miss")
+        self.assertEqual(self.client.get(url)["X-Page-Cache"], "hit")
+
+        other.title = "另一篇"
+        other.save()
+        self.assertEqual(self.client.get(url)["X-Page-Cache"], "hit")
+
+        post.title = "新标题"
+        post.save()
+        self.assertEqual(self.client.get(url)["X-Page-Cache"], "miss")
+
+    def test_purge_while_rendering_is_not_lost(self):
+        post = self.create_post()
+        url = f"/post/{post.id}"
+        get_page = Comment.get_page
+
+        def edited_meanwhile(*args, **kwargs):
+            pagecache.purge(pagecache.post_dep(post.id))
+            return get_page(*args, **kwargs)
+
+        with mock.patch.object(Comment, "get_page", edited_meanwhile):
+            self.assertEqual(self.client.get(url)["X-Page-Cache"], "miss")
+        # stored under the versions from before the purge
+        self.assertEqual(self.client.get(url)["X-Page-Cache"], "miss")
+        self.assertEqual(self.client.get(url)["X-Page-Cache"], "hit")
+
+    def test_cache_hit_still_counts_view(self):
+        post = self.create_post()
+        self.client.get(f"/post/{post.id}")
+        before = pv_buffer.pending(post.id)
+        self.client.get(f"/post/{post.id}")
+        self.assertEqual(pv_buffer.pending(post.id), before + 1)
+
+    def test_authenticated_requests_bypass_cache(self):
+        post = self.create_post()
+        self.client.force_login(self.user)
+        self.assertNotIn("X-Page-Cache", self.client.get(f"/post/{post.id}"))
+
+
+class RecentCommentsTests(BlogTransactionTestCase):
+    def test_prefilled_before_the_first_read(self):
+        post = self.create_post()
+        self.comment(post)
+        buffer = RecentComments(size=3)
+        with mock.patch("blog.signals.recent_comments", buffer):
+            signals.prefill_recent_comments(sender=None)
+        with self.assertNumQueries(0):
+            self.assertEqual(len(buffer.items()), 1)
+
+    def comment(self, post, content="评论", **kwargs) -> Comment:
+        return Comment.objects.create(
+            target=post,
+            author="路人",
+            content=content,
+            home_site="https://example.com",
+            email="a@example.com",
+            **kwargs,
+        )
+
+    def test_ring_buffer_follows_changes(self):
+        post = Post.objects.create(
+            title="标题", desc="简要", content="正文", category=self.category, owner=self.user
+        )
+        comments = [self.comment(post, f"评论{i}") for i in range(4)]
+        buffer = RecentComments(size=3)
+        self.assertEqual(
+            [c.id for c in buffer.items()], [c.id for c in comments[:0:-1]]
+        )
+
+        with mock.patch("blog.signals.recent_comments", buffer):
+            newest = self.comment(post, "最新")
+        with self.assertNumQueries(0):
+            items = buffer.items()
+        self.assertEqual(
+            [c.id for c in items], [newest.id, comments[3].id, comments[2].id]
+        )
+
+        # another process changed the comments
+        bump_version(COMMENTS_VERSION)
+        comments[3].delete()
+        with self.assertNumQueries(1):
+            items = buffer.items()
+        self.assertEqual(
+            [c.id for c in items], [newest.id, comments[2].id, comments[1].id]
+        )
+
+    def test_sidebar_shows_recent_comments(self):
+        post = Post.objects.create(
+            title="标题", desc="简要", content="正文", category=self.category, owner=self.user
+        )
+        sidebar = SideBar.objects.create(
+            title="最近评论", display_type=DISPLAY_COMMENT, owner=self.user
+        )
+        self.comment(post, "第一条")
+        self.assertIn("第一条".encode(), sidebar.render_content())
+        hidden = self.comment(post, "第二条")
+        self.assertIn("第二条".encode(), sidebar.render_content())
+        hidden.status = Comment.STATUS_DELETE
+        hidden.save()
+        self.assertNotIn("第二条".encode(), sidebar.render_content())
+
+
+class InstrumentationTests(BlogTransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        request_metrics.reset()
+
+    def test_histogram_quantiles(self):
+        histogram = Histogram(exponential_buckets(1, 2, 11))
+        for value in range(1, 1001):
+            histogram.observe(value)
+        self.assertEqual(histogram.count, 1000)
+        # within a bucket width of the exact values
+        self.assertTrue(256 <= histogram.quantile(0.5) <= 512)
+        self.assertTrue(512 <= histogram.quantile(0.95) <= 1024)
+        self.assertIsNone(Histogram(TIME_BUCKETS).quantile(0.5))
+
+    def test_requests_are_recorded_by_route(self):
+        post = self.create_post()
+        for _ in range(2):
+            self.assertEqual(self.client.get(f"/post/{post.id}").status_code, 200)
+        self.client.get("/nowhere")
+
+        summary = request_metrics.summary()
+        self.assertEqual(set(summary), {"/post/<int:post_id>", "<unmatched>"})
+        details = request_metrics.routes()["/post/<int:post_id>"]
+        self.assertEqual(details.duration.count, 2)
+        self.assertGreater(details.render_time.sum, 0)
+        self.assertGreater(details.queries.sum, 0)
+        self.assertEqual(summary["/post/<int:post_id>"]["queries"]["count"], 2)
+        self.assertEqual(details.response_size.count, 2)
+
+
+class MetricsTests(BlogTransactionTestCase):
+    # past the largest pid Linux hands out
+    DEAD_PID = 2 ** 22 + 1
+
+    def setUp(self):
+        super().setUp()
+        request_metrics.reset()
+        process_metrics.reset()
+
+    def test_merge_sums_processes_and_drops_dead_gauges(self):
+        live = {
+            "pid": os.getpid(),
+            "counters": [["dinah_cache_requests_total", [["cache", "page"]], 2]],
+            "histograms": [["dinah_request_queries", [["route", "/"]], [1, 2], 3.0]],
+            "gauges": [["dinah_pending_page_views", [], 4]],
+        }
+        dead = {**live, "pid": self.DEAD_PID}
+        merged = merge_samples([live, dead])
+        self.assertEqual(
+            merged["dinah_cache_requests_total"], {(("cache", "page"),): 4}
+        )
+        self.assertEqual(
+            merged["dinah_request_queries"], {(("route", "/"),): ([2, 4], 6.0)}
+        )
+        self.assertEqual(merged["dinah_pending_page_views"], {(): 4})
+
+    def test_endpoint_aggregates_worker_files(self):
+        post = self.create_post()
+        with tempfile.TemporaryDirectory() as directory, self.settings(
+            METRICS_DIR=directory
+        ):
+            other = {
+                "pid": self.DEAD_PID,
+                "counters": [
+                    [
+                        "dinah_cache_requests_total",
+                        [["cache", "page"], ["result", "hit"]],
+                        5,
+                    ]
+                ],
+                "histograms": [],
+                "gauges": [["dinah_pending_page_views", [], 7]],
+            }
+            with open(os.path.join(directory, "1-other.json"), "w") as f:
+                json.dump(other, f)
+            for _ in range(2):
+                self.client.get(f"/post/{post.id}")
+            response = self.client.get("/metrics")
+            # the exited worker is folded into the aggregate, and still counted
+            self.assertNotIn("1-other.json", os.listdir(directory))
+            self.assertIn("exited.json", os.listdir(directory))
+            again = self.client.get("/metrics").content.decode().splitlines()
+            self.assertIn(
+                'dinah_cache_requests_total{cache="page",result="hit"} 6', again
+            )
+
+        self.assertEqual(response.status_code, 200)
+        lines = response.content.decode().splitlines()
+        self.assertIn("# TYPE dinah_request_duration_seconds histogram", lines)
+        self.assertIn('dinah_cache_requests_total{cache="page",result="hit"} 6', lines)
+        self.assertIn(
+            'dinah_request_duration_seconds_count{route="/post/<int:post_id>"} 2', lines
+        )
+        self.assertIn(
+            'dinah_request_duration_seconds_bucket{route="/post/<int:post_id>",le="+Inf"} 2',
+            lines,
+        )
+        # the page cache hit counted its view too
+        self.assertIn("dinah_pending_page_views 2", lines)
+
+    def test_endpoint_is_internal(self):
+        response = self.client.get("/metrics", REMOTE_ADDR="10.0.0.1")
+        self.assertEqual(response.status_code, 403)
+
+
+class ConditionalGetTests(BlogTransactionTestCase):
+    def test_unchanged_page_answers_not_modified_without_queries(self):
+        post = self.create_post()
+        response = self.client.get(f"/post/{post.id}")
+        self.assertTrue(response.has_header("Last-Modified"))
+
+        request = RequestFactory().get(
+            f"/post/{post.id}", HTTP_IF_NONE_MATCH=response["ETag"]
+        )
+        with self.assertNumQueries(0):
+            response = post_details_view(request, post_id=post.id)
+        self.assertEqual(response.status_code, 304)
+
+    def test_not_modified_post_still_counts_the_view(self):
+        post = self.create_post()
+        etag = self.client.get(f"/post/{post.id}")["ETag"]
+        pv_buffer.flush()
+        request = RequestFactory().get(f"/post/{post.id}", HTTP_IF_NONE_MATCH=etag)
+        request.uid = "reader"
+        response = post_details_view(request, post_id=post.id)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(pv_buffer.pending(post.id), 1)
+
+    def test_hotness_refresh_updates_validators(self):
+        posts = [self.create_post() for _ in range(2)]
+        etag = self.client.get("/")["ETag"]
+        for post, views in zip(posts, (1, 9)):
+            PostViewBucket.objects.create(
+                post=post, period=bucket_start(timezone.now()), views=views
+            )
+        refresh_hotness()
+        response = self.client.get("/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_content_change_updates_validators(self):
+        post = self.create_post()
+        etag = self.client.get("/")["ETag"]
+        post.title = "新标题"
+        post.save()
+        response = self.client.get("/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_rerendering_updates_validators_and_cached_pages(self):
+        post = self.create_post()
+        url = f"/post/{post.id}"
+        etag = self.client.get(url)["ETag"]
+        Post.objects.filter(id=post.id).update(render_version=0)
+        call_command("render_posts", workers=1, stdout=io.StringIO())
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["X-Page-Cache"], "miss")
+
+
+class StaticExportTests(BlogTestCase):
+    def test_site_pages_cover_every_listing_page(self):
+        tag = Tag.objects.create(name="标签", owner=self.user)
+        posts = [self.create_post() for _ in range(3)]
+        posts[0].tag.add(tag)
+        self.create_post(status=Post.STATUS_DRAFT)
+
+        with self.settings(POST_LIST_PAGE_SIZE=2):
+            pages = list(site_pages())
+        self.assertEqual(
+            [(page.path, page.after) for page in pages],
+            [
+                ("/", None),
+                ("/", encode_cursor(posts[1].id)),
+                (f"/category/{self.category.id}", None),
+                (f"/category/{self.category.id}", encode_cursor(posts[1].id)),
+                (f"/tag/{tag.id}", None),
+                ("/tags", None),
+            ]
+            + [(f"/post/{post.id}", None) for post in reversed(posts)],
+        )
+
+    def test_export_pages_writes_files(self):
+        post = self.create_post()
+        with tempfile.TemporaryDirectory() as root:
+            pages = [Page("/"), Page(f"/post/{post.id}"), Page("/", after="MQ")]
+            self.assertEqual(len(export_pages(root, pages)), 3)
+            for filename in ("index.html", f"post/{post.id}.html", "page/MQ.html"):
+                self.assertTrue(os.path.exists(os.path.join(root, filename)))
+        self.assertEqual(pv_buffer.pending(post.id), 0)
+
+    def test_listing_links_point_to_exported_files(self):
+        content = (
+            b'<a href="/?after=MTA">next</a>'
+            b'<a href="/category/3?after=Mg">next</a>'
+            b'<a href="/post/1/comments?after=Mg">more</a>'
+        )
+        self.assertEqual(
+            rewrite_links(content),
+            b'<a href="/page/MTA.html">next</a>'
+            b'<a href="/category/3/page/Mg.html">next</a>'
+            b'<a href="/post/1/comments?after=Mg">more</a>',
+        )
+
+    @override_settings(POST_LIST_PAGE_SIZE=2, SIDEBAR_POST_COUNT=1)
+    def test_post_edit_only_stales_pages_showing_it(self):
+        posts = [self.create_post(pv=i) for i in range(5)]
+        started = timezone.now()
+        pages = list(site_pages())
+        with tempfile.TemporaryDirectory() as root:
+            manifest = {
+                "exported_at": started.isoformat(),
+                "pages": export_pages(root, pages),
+                **site_state(),
+            }
+        self.assertEqual(stale_pages(site_pages(), manifest, site_state()), [])
+
+        oldest = posts[0]
+        oldest.title = "新标题"
+        oldest.save()
+        self.assertEqual(
+            [
+                page.filename
+                for page in stale_pages(site_pages(), manifest, site_state())
+            ],
+            [
+                f"page/{encode_cursor(posts[1].id)}.html",
+                f"category/{self.category.id}/page/{encode_cursor(posts[1].id)}.html",
+                f"post/{oldest.id}.html",
+            ],
+        )
+
+
+class ImportPostsTests(BlogTestCase):
+    POSTS = {
+        "2019/hello.md": (
+            "---\n"
+            "title: 你好\n"
+            "category: 随笔\n"
+            "tags: [python, django]\n"
+            "date: 2019-05-01 08:00\n"
+            "---\n"
+            "第一段\n\n第二段\n"
+        ),
+        "draft.markdown": "---\nstatus: draft\ntags:\n  - python\n---\n草稿\n",
+        "notes.txt": "not a post",
+    }
+
+    def import_from(self, path):
+        call_command(
+            "import_posts", path, owner=self.user.username, stdout=io.StringIO()
+        )
+
+    def test_import_tarball(self):
+        with tempfile.TemporaryDirectory() as root:
+            archive = os.path.join(root, "posts.tar.gz")
+            with tarfile.open(archive, "w:gz") as tar:
+                for name, text in self.POSTS.items():
+                    data = text.encode()
+                    info = tarfile.TarInfo(name)
+                    info.size = len(data)
+                    tar.addfile(info, io.BytesIO(data))
+            self.import_from(archive)
+
+        hello = Post.objects.get(title="你好")
+        self.assertEqual(hello.category.name, "随笔")
+        self.assertEqual(hello.desc, "第一段")
+        self.assertEqual(hello.created_time.year, 2019)
+        self.assertIn("<p>第二段</p>", hello.content_html)
+        self.assertEqual(
+            sorted(hello.tag.values_list("name", flat=True)), ["django", "python"]
+        )
+        draft = Post.objects.get(title="draft")
+        self.assertEqual(draft.status, Post.STATUS_DRAFT)
+        self.assertEqual(draft.category, self.category)
+        self.assertEqual(Tag.objects.filter(name="python").count(), 1)
+        if search.is_available():
+            self.assertEqual(search.search_post_ids("第二段"), [hello.id])
+
+    def test_import_directory(self):
+        with tempfile.TemporaryDirectory() as root:
+            for name, text in self.POSTS.items():
+                path = os.path.join(root, name)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write(text)
+            self.import_from(root)
+            self.import_from(root)
+        self.assertEqual(Post.objects.filter(title="你好").count(), 2)
+        self.assertEqual(Category.objects.filter(name="随笔").count(), 1)
+
+    def test_tag_cloud_refreshed_once(self):
+        with tempfile.TemporaryDirectory() as root:
+            for i in range(3):
+                with open(os.path.join(root, f"{i}.md"), "w", encoding="utf-8") as f:
+                    f.write(f"---\ntags: [新标签{i}, python]\n---\n正文\n")
+            with mock.patch("blog.tagcloud.refresh_tag_cloud") as refresh:
+                self.import_from(root)
+        refresh.assert_called_once_with()
+        self.assertEqual(Tag.objects.count(), 4)
+        self.assertEqual(Post.tag.through.objects.filter(tag__name="python").count(), 3)
+
+    def test_lists_for_single_values_are_reported(self):
+        with tempfile.TemporaryDirectory() as root:
+            with open(os.path.join(root, "list.md"), "w", encoding="utf-8") as f:
+                f.write("---\ntitle: [一, 二]\n---\n正文\n")
+            with self.assertRaisesMessage(
+                CommandError, "list.md: title must be a single value"
+            ):
+                self.import_from(root)
+
+    def test_long_tag_names_are_reported(self):
+        with tempfile.TemporaryDirectory() as root:
+            with open(os.path.join(root, "long.md"), "w", encoding="utf-8") as f:
+                f.write("---\ntags: [python, djangorestframework]\n---\n正文\n")
+            with self.assertRaisesMessage(
+                CommandError, "long.md: tag name longer than 10 characters"
+            ):
+                self.import_from(root)
+        self.assertFalse(Tag.objects.exists())
+
+
+class BackupTests(BlogTestCase):
+    def read_lines(self, data: bytes):
+        return [json.loads(line) for line in gzip.decompress(data).splitlines()]
+
+    def test_backup_file_in_chunks(self):
+        tag = Tag.objects.create(name="标签", owner=self.user)
+        posts = [self.create_post() for _ in range(3)]
+        posts[1].tag.add(tag)
+
+        with tempfile.TemporaryDirectory() as root:
+            output = os.path.join(root, "backup.jsonl.gz")
+            # one query a chunk, plus the tags of each chunk of posts
+            with self.assertNumQueries(9):
+                self.assertEqual(write_backup(output, chunk_size=2), 5)
+            with open(output, "rb") as f:
+                records = self.read_lines(f.read())
+
+        self.assertEqual(
+            [r["model"] for r in records],
+            ["blog.category", "blog.tag"] + ["blog.post"] * 3,
+        )
+        post = records[3]
+        self.assertEqual(post["pk"], posts[1].id)
+        self.assertEqual(post["fields"]["tag"], [tag.id])
+        self.assertEqual(post["fields"]["category"], self.category.id)
+        self.assertEqual(post["fields"]["title"], "标题")
+
+    def test_admin_streams_backup(self):
+        self.create_post()
+        User.objects.create_superuser("admin", "admin@example.com", "admin")
+        self.client.login(username="admin", password="admin")
+
+        response = self.client.get("/admin/blog/post/backup/")
+        self.assertTrue(response.streaming)
+        records = self.read_lines(b"".join(response.streaming_content))
+        self.assertEqual(len(records), 2)
+
+        self.client.login(username="dinah", password="dinah")
+        self.assertNotEqual(
+            self.client.get("/admin/blog/post/backup/").status_code, 200
+        )
+
+
+class MigrateTypeideaTests(TransactionTestCase):
+    SCHEMA = """
+        CREATE TABLE auth_user (
+            id integer PRIMARY KEY, password varchar(128), last_login datetime NULL,
+            is_superuser bool, username varchar(150), first_name varchar(30),
+            last_name varchar(30), email varchar(254), is_staff bool, is_active bool,
+            date_joined datetime
+        );
+        CREATE TABLE blog_category (
+            id integer PRIMARY KEY, name varchar(50), status integer, is_nav bool,
+            owner_id integer, created_time datetime
+        );
+        CREATE TABLE blog_tag (
+            id integer PRIMARY KEY, name varchar(10), status integer,
+            owner_id integer, created_time datetime
+        );
+        CREATE TABLE blog_post (
+            id integer PRIMARY KEY, title varchar(255), "desc" varchar(1024),
+            content text, status integer, category_id integer, owner_id integer,
+            created_time datetime
+        );
+        CREATE TABLE blog_post_tag (id integer PRIMARY KEY, post_id integer, tag_id integer);
+        CREATE TABLE config_link (
+            id integer PRIMARY KEY, title varchar(50), href varchar(200), status integer,
+            weight integer, owner_id integer, created_time datetime
+        );
+        CREATE TABLE config_sidebar (
+            id integer PRIMARY KEY, title varchar(50), display_type integer,
+            content varchar(500), status integer, owner_id integer, created_time datetime
+        );
+        CREATE TABLE comment_comment (
+            id integer PRIMARY KEY, target_id integer, content varchar(2000),
+            nickname varchar(50), website varchar(200), email varchar(254),
+            status integer, created_time datetime
+        );
+        INSERT INTO auth_user VALUES
+            (7, 'x', NULL, 1, 'legacy', '', '', '', 1, 1, '2018-03-10 07:00:00');
+        INSERT INTO blog_category VALUES (3, '旧分类', 1, 1, 7, '2018-03-10 07:00:00');
+        INSERT INTO blog_tag VALUES (4, '旧标签', 0, 7, '2018-03-10 07:00:00');
+        INSERT INTO blog_post VALUES
+            (10, '旧文章', '', '**旧**', 2, 3, 7, '2018-03-11 08:00:00'),
+            (12, '旧文章2', '', '正文', 1, 3, 7, '2018-03-12 08:00:00');
+        INSERT INTO blog_post_tag VALUES (1, 12, 4);
+        INSERT INTO config_link VALUES (1, '友链', 'https://example.com', 1, 5, 7,
+            '2018-03-10 07:00:00');
+        INSERT INTO config_sidebar VALUES (2, '最新', 2, '', 0, 7, '2018-03-10 07:00:00');
+        INSERT INTO comment_comment VALUES (5, 12, '评论', '路人', 'https://example.com',
+            'a@example.com', 1, '2018-03-13 08:00:00');
+    """
+
+    def test_copy_keeps_ids_and_resumes(self):
+        with tempfile.TemporaryDirectory() as root:
+            legacy = os.path.join(root, "typeidea.sqlite3")
+            with sqlite3.connect(legacy) as db:
+                db.executescript(self.SCHEMA)
+            checkpoint = os.path.join(root, "checkpoint.json")
+            options = dict(batch_size=1, checkpoint=checkpoint, stdout=io.StringIO())
+            call_command("migrate_typeidea", legacy, **options)
+            with open(checkpoint) as f:
+                self.assertEqual(json.load(f)["blog_post"], 12)
+            # resuming finds nothing left to copy
+            call_command("migrate_typeidea", legacy, **options)
+
+        draft, post = Post.objects.order_by("id")
+        self.assertEqual((draft.id, post.id), (10, 12))
+        self.assertEqual(draft.status, Post.STATUS_DRAFT)
+        self.assertIn("<strong>旧</strong>", draft.content_html)
+        self.assertEqual(post.created_time.isoformat(), "2018-03-12T08:00:00+00:00")
+        self.assertEqual(post.owner.username, "legacy")
+        self.assertEqual(list(post.tag.values_list("id", "status")), [(4, 0)])
+        self.assertEqual(Link.objects.get().rank, 5)
+        self.assertEqual(SideBar.objects.get().status, SideBar.STATUS_HIDE)
+        comment = Comment.objects.get()
+        self.assertEqual((comment.target_id, comment.author), (12, "路人"))
+        # typeidea kept no view counts, nothing to rank the posts by
+        self.assertEqual((post.pv, post.uv), (1, 1))
+        self.assertFalse(Post.hot_posts().exists())
+
+    def test_refuses_a_database_with_users(self):
+        User.objects.create_user(username="admin", password="admin")
+        with tempfile.TemporaryDirectory() as root:
+            legacy = os.path.join(root, "typeidea.sqlite3")
+            with sqlite3.connect(legacy) as db:
+                db.executescript(self.SCHEMA)
+            with self.assertRaisesMessage(CommandError, "already has users"):
+                call_command(
+                    "migrate_typeidea",
+                    legacy,
+                    checkpoint=os.path.join(root, "checkpoint.json"),
+                    stdout=io.StringIO(),
+                )
+        self.assertFalse(Post.objects.exists())
+
+
+class BenchmarkTests(BlogTestCase):
+    def test_synthetic_blog_is_reproducible_and_consistent(self):
+        counts = SyntheticBlog(60, seed=1, batch_size=25).generate()
+        self.assertEqual(counts["posts"], 60)
+        titles = list(Post.objects.order_by("id").values_list("title", flat=True))
+
+        published = Post.objects.filter(status=Post.STATUS_NORMAL)
+        for category in Category.objects.exclude(id=self.category.id):
+            self.assertEqual(
+                category.post_count, published.filter(category=category).count()
+            )
+        self.assertFalse(Post.objects.filter(created_time__gt=timezone.now()).exists())
+        for reply in Comment.objects.filter(parent__isnull=False):
+            self.assertEqual(reply.root_id, reply.parent.root_id)
+            self.assertTrue(reply.path.startswith(reply.parent.path))
+
+        Post.objects.all().delete()
+        Tag.objects.all().delete()
+        Category.objects.exclude(id=self.category.id).delete()
+        User.objects.exclude(id=self.user.id).delete()
+        SyntheticBlog(60, seed=1, batch_size=25).generate()
+        self.assertEqual(
+            list(Post.objects.order_by("id").values_list("title", flat=True)), titles
+        )
+
+    def test_benchmarks_run_and_compare(self):
+        SyntheticBlog(30, seed=2).generate()
+        benchmarks = {benchmark.name: benchmark for benchmark in build_benchmarks()}
+        results = {
+            name: vars(run_benchmark(benchmarks[name], repeat=2, warmup=1))
+            for name in ("post_list/cold", "tag_list/warm", "admin_posts")
+        }
+        self.assertGreater(results["post_list/cold"]["queries"], 0)
+        self.assertEqual(compare(results, results, threshold=1.25), [])
+
+        slower = {
+            name: {**result, "median_ms": result["median_ms"] * 2 + 2}
+            for name, result in results.items()
+        }
+        more_queries = {**results["tag_list/warm"], "queries": 99}
+        self.assertEqual(
+            compare({**slower, "tag_list/warm": more_queries}, results, 1.25),
+            ["post_list/cold", "tag_list/warm", "admin_posts"],
+        )
@@ -1,40 +1,168 @@
-import dataclasses
+import functools
 
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
 from django.http import HttpResponse
+from django.views.decorators.http import condition
 
-from blog.models import Tag, Post, Category, SideBar
+from blog import pagecache, search, tagcloud
+from blog.cache import CONTENT_VERSION, get_version, version_time
+from blog.models import Tag, Post, PostSummary, Category, Comment, SideBar
+from utils import metrics
+from utils.pagination import KeysetPage, paginate_by_id
 from utils.shortcuts import render_mako
 
 
+def _content_version(request, *args, **kwargs) -> int:
+    if not hasattr(request, "content_version"):
+        request.content_version = get_version(CONTENT_VERSION)
+    return request.content_version
+
+
+def _content_etag(request, *args, **kwargs) -> str:
+    return str(_content_version(request))
+
+
+def _content_last_modified(request, *args, **kwargs):
+    return version_time(_content_version(request))
+
+
+# answers If-None-Match / If-Modified-Since with a 304 before the view runs any query
+content_condition = condition(
+    etag_func=_content_etag, last_modified_func=_content_last_modified
+)
+
+
+def count_revalidated_views(view):
+    """Count the view of a post answered with a 304, the view itself didn't run."""
+
+    @functools.wraps(view)
+    def wrapper(request, post_id, *args, **kwargs):
+        response = view(request, post_id, *args, **kwargs)
+        if response.status_code == 304:
+            # NOTE: views of a missing post are dropped when the buffer is flushed
+            pagecache.count_view(request, post_id)
+        return response
+
+    return wrapper
+
+
+@content_condition
 def post_list_view(request, category_id=None, tag_id=None):
     tag = None
     category = None
+    pagecache.depends_on(request, pagecache.SIDEBARS, pagecache.NAVS, pagecache.TAGS)
     if tag_id:
+        pagecache.depends_on(
+            request, pagecache.tag_dep(tag_id), pagecache.tag_posts_dep(tag_id)
+        )
         posts, tag = Post.get_by_tag(tag_id)
     elif category_id:
+        pagecache.depends_on(
+            request,
+            pagecache.category_dep(category_id),
+            pagecache.category_posts_dep(category_id),
+        )
         posts, category = Post.get_by_category(category_id)
     else:
+        pagecache.depends_on(request, pagecache.LATEST_POSTS)
         posts = Post.latest_post()
+    page = paginate_by_id(
+        Post.summarize(posts),
+        after=request.GET.get("after"),
+        per_page=settings.POST_LIST_PAGE_SIZE,
+    )
 
     context = {
-        "posts": posts,
+        "posts": PostSummary.from_rows(page.items),
+        "page": page,
         "category": category,
         "tag": tag,
         "sidebars": SideBar.get_all(),
     }
-    context.update(dataclasses.asdict(Category.get_navs()))
+    context.update(Category.get_navs().as_context())
     return render_mako(request, "blog/post_list.mako", context=context,)
 
 
+@count_revalidated_views
+@content_condition
 def post_details_view(request, post_id):
+    pagecache.depends_on(request, pagecache.post_dep(post_id), pagecache.NAVS)
     try:
-        post = Post.objects.get(id=post_id)
+        post = Post.objects.defer("content").get(id=post_id)
     except Post.DoesNotExist:
         post = None
-    context = {"post": post}
-    context.update(dataclasses.asdict(Category.get_navs()))
+    else:
+        pagecache.count_view(request, post.id)
+        # NOTE: moving the post to other tags purges post_dep, already declared above
+        tag_ids = post.tag.values_list("id", flat=True)
+        pagecache.depends_on(
+            request, *pagecache.post_deps(post.id, post.category_id, tag_ids)
+        )
+    context = {"post": post, "comments": None}
+    if post is not None:
+        context["comments"] = Comment.get_page(
+            post.id, per_page=settings.COMMENT_PAGE_SIZE
+        )
+    context.update(Category.get_navs().as_context())
     return render_mako(request, "blog/post_details.mako", context=context,)
 
 
+@content_condition
+def comments_view(request, post_id):
+    """Following pages of the comments of a post, as an HTML fragment."""
+    pagecache.depends_on(request, pagecache.post_dep(post_id))
+    page = Comment.get_page(
+        post_id, after=request.GET.get("after"), per_page=settings.COMMENT_PAGE_SIZE
+    )
+    context = {"post_id": post_id, "comments": page}
+    return render_mako(request, "blocks/comments.mako", context=context)
+
+
+@content_condition
+def search_view(request):
+    query = request.GET.get("q", "").strip()
+    post_ids = search.search_post_ids(
+        query, status=Post.STATUS_NORMAL, limit=settings.SEARCH_RESULT_LIMIT
+    )
+    found = {
+        post.id: post
+        for post in PostSummary.from_rows(
+            Post.summarize(
+                Post.objects.filter(status=Post.STATUS_NORMAL, id__in=post_ids)
+            )
+        )
+    }
+    posts = [found[post_id] for post_id in post_ids if post_id in found]
+
+    context = {
+        "posts": posts,
+        "page": KeysetPage(items=posts, after=None, next_after=None),
+        "query": query,
+        "category": None,
+        "tag": None,
+        "sidebars": SideBar.get_all(),
+    }
+    context.update(Category.get_navs().as_context())
+    return render_mako(request, "blog/post_list.mako", context=context,)
+
+
+@content_condition
+def tags_view(request):
+    pagecache.depends_on(request, pagecache.TAGS, pagecache.NAVS)
+    context = {"tags": tagcloud.tag_cloud_items()}
+    context.update(Category.get_navs().as_context())
+    return render_mako(request, "blog/tags.mako", context=context)
+
+
+def metrics_view(request):
+    """Metrics of every worker process in the Prometheus text format."""
+    if request.META.get("REMOTE_ADDR") not in settings.INTERNAL_IPS:
+        raise PermissionDenied
+    return HttpResponse(
+        metrics.exposition(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
 def links_view(args):
     return HttpResponse("links")
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
+import datetime
 import os
 
 # /home/l8ng/Repo/Jetbrains/Dinah/dinah
@@ -43,13 +44,17 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "blog.middleware.InstrumentationMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
+    "django.middleware.http.ConditionalGetMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "blog.middleware.UserIDMiddleware",
+    "blog.pagecache.PageCacheMiddleware",
 ]
 
 ROOT_URLCONF = "urls"
@@ -73,6 +78,14 @@ TEMPLATES = [
         "NAME": "mako",
         "DIRS": [os.path.join(BASE_DIR, "templates"),],
         "APP_DIRS": True,
+        "OPTIONS": {
+            # compiled templates, prepared by `manage.py compile_templates` at deploy time
+            "module_directory": os.path.join(
+                os.path.dirname(BASE_DIR), ".mako_modules"
+            ),
+            # NOTE: turn off in production so modules are loaded without a stat per template
+            "filesystem_checks": DEBUG,
+        },
     },
 ]
 
@@ -88,6 +101,20 @@ DATABASES = {
     }
 }
 
+# Cache
+# https://docs.djangoproject.com/en/2.2/topics/cache/
+# NOTE: invalidation is versioned through this cache. LocMemCache is per process: with
+# several workers a change only reaches the worker that made it, the others keep
+# their navs and sidebars until these expire (navs never do). Use a shared backend
+# such as memcached when running more than one worker.
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "dinah",
+    }
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
@@ -117,3 +144,60 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/2.2/howto/static-files/
 
 STATIC_URL = "/static/"
+
+# Page view counter
+# Seconds between write-behind flushes of buffered `Post.pv` deltas and visitor sketches, 0 disables the flusher thread
+
+PV_FLUSH_INTERVAL = 10
+
+PV_FLUSH_BATCH_SIZE = 500
+
+# Hot posts, views of hourly buckets decay with a half-life in seconds
+
+# NOTE: the ranking only moves when `manage.py refresh_hot_posts` runs, schedule it
+# once a minute from cron or a systemd timer, on one host only
+
+HOT_HALF_LIFE = 60 * 60 * 24
+
+HOT_BUCKET_RETENTION = datetime.timedelta(days=30)
+
+# Tag cloud, weights bucketed into size classes
+# NOTE: tag edits refresh it at once, post counts only when `manage.py refresh_tag_cloud`
+# runs, schedule it every few minutes like the above
+
+TAG_CLOUD_CLASSES = 5
+
+# Pagination
+
+POST_LIST_PAGE_SIZE = 10
+
+COMMENT_PAGE_SIZE = 20
+
+# Fragment cache
+
+SIDEBAR_CACHE_TIMEOUT = 60 * 5
+
+SIDEBAR_POST_COUNT = 10
+
+RECENT_COMMENT_COUNT = 10
+
+# Full-page cache for anonymous readers, purged by dependency
+
+PAGE_CACHE_TIMEOUT = 60 * 10
+
+# Full-text search
+
+SEARCH_RESULT_LIMIT = 50
+
+# Static export
+
+STATIC_EXPORT_ROOT = os.path.join(os.path.dirname(BASE_DIR), "public")
+
+# Metrics, `/metrics` answers these addresses only
+
+INTERNAL_IPS = ["127.0.0.1"]
+
+# NOTE: set to a directory shared by the workers to sum the metrics of all of them
+METRICS_DIR = None
+
+METRICS_FLUSH_INTERVAL = 15
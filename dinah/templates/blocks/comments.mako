@@ -0,0 +1,12 @@
+<ol class="comments">
+% for comment in comments.items:
+    <li class="comment depth-${comment.depth}" id="comment-${comment.id}">
+        <a href="${comment.home_site | h}" rel="nofollow">${comment.author | h}</a>
+        <time>${comment.created_time.strftime("%Y-%m-%d %H:%M")}</time>
+        <p>${comment.content | h}</p>
+    </li>
+% endfor
+</ol>
+% if comments.has_next:
+<a class="more-comments" href="/post/${post_id}/comments?after=${comments.next_after}">更多评论</a>
+% endif
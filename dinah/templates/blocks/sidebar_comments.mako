@@ -0,0 +1,5 @@
+<ul>
+% for comment in comments:
+    <li><a href="/post/${comment.post_id}#comment-${comment.id}">${comment.author | h}</a>: ${comment.content | h}</li>
+% endfor
+</ul>
@@ -0,0 +1,5 @@
+<ul>
+% for post in posts:
+    <li><a href="/post/${post.id}">${post.title | h}</a></li>
+% endfor
+</ul>
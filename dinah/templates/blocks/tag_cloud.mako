@@ -0,0 +1,5 @@
+<ul class="tag-cloud">
+% for tag in tags:
+    <li class="tag-size-${tag.weight}"><a href="/tag/${tag.id}" title="${tag.post_count}篇文章">${tag.name | h}</a></li>
+% endfor
+</ul>
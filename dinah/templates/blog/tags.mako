@@ -0,0 +1,2 @@
+<h1>标签</h1>
+<%include file="/blocks/tag_cloud.mako"/>
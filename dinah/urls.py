@@ -16,13 +16,25 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path
 
-from blog.views import post_list_view, post_details_view, links_view
+from blog.views import (
+    comments_view,
+    links_view,
+    metrics_view,
+    post_details_view,
+    post_list_view,
+    search_view,
+    tags_view,
+)
 
 urlpatterns = [
     path("", post_list_view),
     path("category/<int:category_id>", post_list_view),
     path("tag/<int:tag_id>", post_list_view),
     path("post/<int:post_id>", post_details_view),
+    path("post/<int:post_id>/comments", comments_view),
+    path("search", search_view),
+    path("tags", tags_view),
     path("links/", links_view),
+    path("metrics", metrics_view),
     path("admin/", admin.site.urls),
 ]
@@ -0,0 +1,190 @@
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence
+
+
+def exponential_buckets(start: float, factor: float, count: int) -> List[float]:
+    # rounded to 4 significant digits, they end up as labels
+    return [float(f"{start * factor ** i:.4g}") for i in range(count)]
+
+
+# steps of about 41%: seconds from 0.1ms to ~54s, queries from 1 to 1024,
+# bytes from 64B to ~64MB
+TIME_BUCKETS = exponential_buckets(0.0001, 2 ** 0.5, 40)
+COUNT_BUCKETS = exponential_buckets(1, 2 ** 0.5, 21)
+SIZE_BUCKETS = exponential_buckets(64, 2 ** 0.5, 41)
+
+
+class Histogram:
+    """Counts of observations in fixed buckets, upper bounds inclusive.
+
+    Recording is a bisect and two additions, the memory is fixed whatever
+    the number of observations; quantiles are interpolated inside a bucket,
+    so they are exact to a bucket width.
+    """
+
+    __slots__ = ("bounds", "counts", "count", "sum")
+
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = bounds
+        # the last bucket takes everything above the highest bound
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def merge(self, other: "Histogram"):
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.count += other.count
+        self.sum += other.sum
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                if i == len(self.bounds):
+                    return self.bounds[-1]
+                low = self.bounds[i - 1] if i else 0.0
+                return low + (self.bounds[i] - low) * (rank - seen) / count
+            seen += count
+        return self.bounds[-1]
+
+
+class RequestStats:
+    """What one request spent, filled while it runs."""
+
+    __slots__ = ("queries", "query_time", "render_time")
+
+    def __init__(self):
+        self.queries = 0
+        self.query_time = 0.0
+        self.render_time = 0.0
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        """For `connection.execute_wrapper()`."""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.query_time += time.perf_counter() - started
+            self.queries += 1
+
+
+_local = threading.local()
+
+
+def current_stats() -> Optional[RequestStats]:
+    return getattr(_local, "stats", None)
+
+
+@contextmanager
+def collecting(stats: RequestStats):
+    """Make `stats` the current stats of the thread."""
+    previous = current_stats()
+    _local.stats = stats
+    try:
+        yield stats
+    finally:
+        _local.stats = previous
+
+
+@contextmanager
+def timed_render():
+    """Add the time spent in the block to the render time of the current request."""
+    stats = current_stats()
+    if stats is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.render_time += time.perf_counter() - started
+
+
+class RouteMetrics:
+    """Histograms of the requests to one URL pattern."""
+
+    __slots__ = ("duration", "queries", "query_time", "render_time", "response_size")
+
+    def __init__(self):
+        self.duration = Histogram(TIME_BUCKETS)
+        self.queries = Histogram(COUNT_BUCKETS)
+        self.query_time = Histogram(TIME_BUCKETS)
+        self.render_time = Histogram(TIME_BUCKETS)
+        self.response_size = Histogram(SIZE_BUCKETS)
+
+
+class RequestMetrics:
+    """Per URL pattern histograms of the requests served by this process."""
+
+    QUANTILES = (0.5, 0.95, 0.99)
+
+    def __init__(self):
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._routes: Dict[str, RouteMetrics] = {}
+
+    def record(
+        self,
+        route: str,
+        duration: float,
+        stats: RequestStats,
+        response_size: Optional[int],
+    ):
+        if self._pid != os.getpid():
+            # NOTE: requests inherited from the parent process are the parent's
+            self._pid = os.getpid()
+            self.reset()
+        with self._lock:
+            metrics = self._routes.get(route)
+            if metrics is None:
+                metrics = self._routes[route] = RouteMetrics()
+            metrics.duration.observe(duration)
+            metrics.queries.observe(stats.queries)
+            metrics.query_time.observe(stats.query_time)
+            metrics.render_time.observe(stats.render_time)
+            if response_size is not None:
+                metrics.response_size.observe(response_size)
+
+    def routes(self) -> Dict[str, RouteMetrics]:
+        with self._lock:
+            return dict(self._routes)
+
+    def summary(self) -> Dict[str, dict]:
+        """{route: {metric: {"count", "mean", "p50", "p95", "p99"}}}"""
+        result = {}
+        with self._lock:
+            for route, metrics in sorted(self._routes.items()):
+                result[route] = {
+                    name: self._summarize(getattr(metrics, name))
+                    for name in RouteMetrics.__slots__
+                }
+        return result
+
+    def _summarize(self, histogram: Histogram) -> dict:
+        summary = {
+            "count": histogram.count,
+            "mean": histogram.sum / histogram.count if histogram.count else None,
+        }
+        for q in self.QUANTILES:
+            summary[f"p{int(q * 100)}"] = histogram.quantile(q)
+        return summary
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+
+
+request_metrics = RequestMetrics()
@@ -0,0 +1,295 @@
+"""Prometheus text exposition of the process metrics, summed over processes.
+
+Every process writes what it counted to a file of its own in `METRICS_DIR`,
+at most every `METRICS_FLUSH_INTERVAL` seconds and when it exits; `/metrics`
+adds the files up. The files of exited processes are folded into a single
+aggregate file when scraping: their counters and histograms stay in the
+sums, their gauges are dropped. Without `METRICS_DIR` only the serving
+process is seen.
+"""
+import atexit
+import fcntl
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+
+from utils.instrumentation import RouteMetrics, request_metrics
+
+Labels = Tuple[Tuple[str, str], ...]
+
+# in `METRICS_DIR`, the sums of the processes gone
+AGGREGATE_FILENAME = "exited.json"
+LOCK_FILENAME = ".lock"
+
+# (metric, `RouteMetrics` attribute, help), labelled by URL pattern
+ROUTE_HISTOGRAMS = (
+    (
+        "dinah_request_duration_seconds",
+        "duration",
+        "Time to answer a request, middleware included.",
+    ),
+    ("dinah_request_queries", "queries", "Database queries run by a request."),
+    (
+        "dinah_request_query_seconds",
+        "query_time",
+        "Time a request spent in database queries.",
+    ),
+    (
+        "dinah_template_render_seconds",
+        "render_time",
+        "Time a request spent rendering Mako templates.",
+    ),
+    ("dinah_response_size_bytes", "response_size", "Size of the response body."),
+)
+
+BUCKET_BOUNDS = {
+    name: getattr(RouteMetrics(), attr).bounds for name, attr, _ in ROUTE_HISTOGRAMS
+}
+
+COUNTERS = {
+    "dinah_cache_requests_total": "Cache lookups, by cache and result.",
+}
+
+GAUGES: Dict[str, Tuple[str, Callable[[], float]]] = {}
+
+
+def register_gauge(name: str, help_text: str, read: Callable[[], float]):
+    """Sample `read()` with the other metrics of the process."""
+    GAUGES[name] = (help_text, read)
+
+
+class ProcessMetrics:
+    """Counters of this process, and the file it shares them through."""
+
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._last_flush = time.monotonic()
+        # a later process reusing the pid must not overwrite our file
+        self._filename = f"{self._pid}-{uuid.uuid4().hex[:8]}.json"
+
+    def _check_fork(self):
+        # NOTE: counts inherited from the parent process are the parent's
+        if self._pid != os.getpid():
+            self._reset()
+
+    def incr(self, name: str, labels: Labels, amount: float = 1):
+        self._check_fork()
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+
+    def sample(self) -> dict:
+        """What this process counted so far, as written to its file."""
+        self._check_fork()
+        with self._lock:
+            counters = [
+                [name, list(labels), value]
+                for (name, labels), value in self._counters.items()
+            ]
+        histograms = []
+        for route, metrics in request_metrics.routes().items():
+            for name, attr, _ in ROUTE_HISTOGRAMS:
+                histogram = getattr(metrics, attr)
+                histograms.append(
+                    [name, [["route", route]], list(histogram.counts), histogram.sum]
+                )
+        gauges = [[name, [], read()] for name, (_, read) in GAUGES.items()]
+        return {
+            "pid": self._pid,
+            "counters": counters,
+            "histograms": histograms,
+            "gauges": gauges,
+        }
+
+    def flush(self):
+        directory = getattr(settings, "METRICS_DIR", None)
+        if not directory:
+            return
+        self._check_fork()
+        self._last_flush = time.monotonic()
+        os.makedirs(directory, exist_ok=True)
+        _write_sample(directory, self._filename, self.sample())
+
+    def maybe_flush(self):
+        interval = getattr(settings, "METRICS_FLUSH_INTERVAL", 15)
+        if time.monotonic() - self._last_flush >= interval:
+            self.flush()
+
+    def samples(self) -> List[dict]:
+        """The samples of every process sharing `METRICS_DIR`, ours refreshed."""
+        directory = getattr(settings, "METRICS_DIR", None)
+        if not directory:
+            return [self.sample()]
+        self.flush()
+        with open(os.path.join(directory, LOCK_FILENAME), "w") as lock:
+            # NOTE: two processes scraping at once would fold the same files twice
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            samples = _read_samples(directory)
+            _fold_exited(directory, samples)
+        return list(samples.values())
+
+
+def _write_sample(directory: str, filename: str, sample: dict):
+    """Replace the file at once, readers never see it half written."""
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(json.dumps(sample).encode())
+        os.replace(tmp_path, os.path.join(directory, filename))
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _read_samples(directory: str) -> Dict[str, dict]:
+    samples = {}
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(directory, filename), "rb") as f:
+                samples[filename] = json.load(f)
+        except (OSError, ValueError):
+            # removed meanwhile, or not ours
+            continue
+    return samples
+
+
+def _fold_exited(directory: str, samples: Dict[str, dict]):
+    """Move the counts of exited processes into the aggregate file, in place."""
+    exited = [
+        filename
+        for filename, sample in samples.items()
+        if filename != AGGREGATE_FILENAME and not _is_alive(sample["pid"])
+    ]
+    if not exited:
+        return
+    folded = [samples[AGGREGATE_FILENAME]] if AGGREGATE_FILENAME in samples else []
+    folded += [{**samples.pop(filename), "gauges": []} for filename in exited]
+    aggregate = {"pid": None, "counters": [], "histograms": [], "gauges": []}
+    for name, series in merge_samples(folded).items():
+        for labels, value in series.items():
+            labels = [list(label) for label in labels]
+            if name in BUCKET_BOUNDS:
+                aggregate["histograms"].append([name, labels, *value])
+            else:
+                aggregate["counters"].append([name, labels, value])
+    _write_sample(directory, AGGREGATE_FILENAME, aggregate)
+    samples[AGGREGATE_FILENAME] = aggregate
+    for filename in exited:
+        try:
+            os.unlink(os.path.join(directory, filename))
+        except FileNotFoundError:
+            pass
+
+
+process_metrics = ProcessMetrics()
+
+atexit.register(process_metrics.flush)
+
+
+def count_cache(cache_name: str, hit: bool):
+    process_metrics.incr(
+        "dinah_cache_requests_total",
+        (("cache", cache_name), ("result", "hit" if hit else "miss")),
+    )
+
+
+def _is_alive(pid: Optional[int]) -> bool:
+    if pid is None:
+        # the aggregate of exited processes
+        return False
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def merge_samples(samples: Iterable[dict]) -> Dict[str, Dict[Labels, object]]:
+    """{metric: {labels: value}}, histogram values are (counts, sum)."""
+    merged: Dict[str, Dict[Labels, object]] = {}
+    for sample in samples:
+        for name, labels, value in sample["counters"]:
+            series = merged.setdefault(name, {})
+            labels = tuple(map(tuple, labels))
+            series[labels] = series.get(labels, 0) + value
+        for name, labels, counts, total in sample["histograms"]:
+            series = merged.setdefault(name, {})
+            labels = tuple(map(tuple, labels))
+            if labels in series:
+                previous, previous_total = series[labels]
+                counts = [a + b for a, b in zip(previous, counts)]
+                total += previous_total
+            series[labels] = (counts, total)
+        alive = _is_alive(sample["pid"])
+        for name, labels, value in sample["gauges"]:
+            series = merged.setdefault(name, {})
+            labels = tuple(map(tuple, labels))
+            series[labels] = series.get(labels, 0) + (value if alive else 0)
+    return merged
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def _format_labels(labels: Iterable[Tuple[str, str]]) -> str:
+    pairs = ",".join(f'{key}="{_escape(str(value))}"' for key, value in labels)
+    return f"{{{pairs}}}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_text(merged: Dict[str, Dict[Labels, object]]) -> str:
+    """The merged metrics in the Prometheus text exposition format 0.0.4."""
+    families = [
+        (name, "histogram", help_text) for name, _, help_text in ROUTE_HISTOGRAMS
+    ]
+    families += [(name, "counter", help_text) for name, help_text in COUNTERS.items()]
+    families += [(name, "gauge", help_text) for name, (help_text, _) in GAUGES.items()]
+
+    lines = []
+    for name, kind, help_text in families:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in sorted(merged.get(name, {}).items()):
+            if kind != "histogram":
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+                continue
+            counts, total = value
+            cumulative = 0
+            for bound, count in zip(BUCKET_BOUNDS[name] + [float("inf")], counts):
+                cumulative += count
+                le = _format_labels(labels + (("le", _format_value(float(bound))),))
+                lines.append(f"{name}_bucket{le} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+def exposition() -> str:
+    return render_text(merge_samples(process_metrics.samples()))
@@ -0,0 +1,101 @@
+import base64
+import binascii
+import dataclasses
+import json
+from typing import Any, List, Optional, Sequence
+
+from django.db.models import Q, QuerySet
+from django.http import Http404
+
+
+@dataclasses.dataclass
+class KeysetPage:
+    items: List[Any]
+    after: Optional[str]
+    next_after: Optional[str]
+
+    @property
+    def has_next(self) -> bool:
+        return self.next_after is not None
+
+    @property
+    def is_first(self) -> bool:
+        return self.after is None
+
+
+def encode_cursor(pk: int) -> str:
+    return base64.urlsafe_b64encode(str(pk).encode()).decode().rstrip("=")
+
+
+def decode_cursor(token: str) -> int:
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        return int(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        raise Http404("无效的分页参数")
+
+
+def paginate_by_id(
+    objects: Sequence, after: str = None, per_page: int = 10
+) -> KeysetPage:
+    """Keyset pagination over objects ordered by `-id`.
+
+    The page is sliced with `id < cursor` instead of OFFSET, and one extra row
+    is fetched to tell whether a next page exists, so no COUNT(*) is issued
+    and page N costs the same as page 1.
+    """
+    if isinstance(objects, QuerySet):
+        qs = objects.order_by("-id")
+        if after:
+            qs = qs.filter(id__lt=decode_cursor(after))
+        rows = list(qs[: per_page + 1])
+    else:
+        rows = list(objects)
+        if after:
+            cursor = decode_cursor(after)
+            rows = [obj for obj in rows if obj.id < cursor]
+        rows = rows[: per_page + 1]
+    items = rows[:per_page]
+    next_after = encode_cursor(items[-1].id) if len(rows) > per_page else None
+    return KeysetPage(items=items, after=after, next_after=next_after)
+
+
+def encode_keys(keys: Sequence) -> str:
+    data = json.dumps(list(keys), separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def decode_keys(token: str, size: int) -> list:
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        keys = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        raise Http404("无效的分页参数")
+    if not isinstance(keys, list) or len(keys) != size:
+        raise Http404("无效的分页参数")
+    return keys
+
+
+def paginate_by_keys(
+    qs: QuerySet, fields: Sequence[str], after: str = None, per_page: int = 10
+) -> KeysetPage:
+    """Keyset pagination over a unique, ascending composite key.
+
+    The cursor holds the key of the last row, and the next page starts with
+    `(a, b) > (x, y)` spelled as `a > x OR (a = x AND b > y)`, which an index
+    over `fields` answers with one range scan.
+    """
+    qs = qs.order_by(*fields)
+    if after:
+        keys = decode_keys(after, len(fields))
+        condition = Q()
+        for i, field in enumerate(fields):
+            equal = {f: key for f, key in zip(fields[:i], keys)}
+            condition |= Q(**equal, **{f"{field}__gt": keys[i]})
+        qs = qs.filter(condition)
+    rows = list(qs[: per_page + 1])
+    items = rows[:per_page]
+    next_after = None
+    if len(rows) > per_page:
+        next_after = encode_keys([getattr(items[-1], field) for field in fields])
+    return KeysetPage(items=items, after=after, next_after=next_after)
@@ -6,6 +6,8 @@ from django.shortcuts import render
 # NOTE: Enum class `status`, `content_type`
 from django.template.loader import render_to_string
 
+from utils.instrumentation import timed_render
+
 
 def render_mako(
     request,
@@ -14,17 +16,19 @@ def render_mako(
     content_type: str = None,
     status: int = None,
 ):
-    return render(
-        request=request,
-        template_name=template_name,
-        context=context,
-        content_type=content_type,
-        status=status,
-        using="mako",
-    )
+    with timed_render():
+        return render(
+            request=request,
+            template_name=template_name,
+            context=context,
+            content_type=content_type,
+            status=status,
+            using="mako",
+        )
 
 
 def render_mako_to_string(template_name: str, context: dict = None, request=None):
-    return render_to_string(
-        request=request, template_name=template_name, context=context, using="mako",
-    )
+    with timed_render():
+        return render_to_string(
+            request=request, template_name=template_name, context=context, using="mako",
+        )